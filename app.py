@@ -1,6 +1,7 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
+import consultas
+import graficos
 
 # ========================
 # 1. Configuração do app
@@ -8,6 +9,46 @@ import plotly.express as px
 st.set_page_config(page_title="Diferença de Preços", layout="wide")
 st.title("📊 Comparação de preços por produto e estado")
 
+# ========================
+# Figuras (JSON em cache enquanto a tabela agregada não mudar)
+# ========================
+@st.cache_data(max_entries=32, show_spinner=False)
+def figura_mais_solicitados(df_group):
+    return graficos.serializar(graficos.barras_por_grupo(
+        df_group["UF Cliente"],
+        df_group["Preço Médio Venda"],
+        df_group["Produto"],
+        nome_x="UF Cliente",
+        nome_y="Preço Médio Venda",
+        nome_grupo="Produto",
+        titulo="Preço médio do produto mais solicitado em cada estado",
+    ))
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def figura_precos_produto(df_filtrado, produto):
+    return graficos.serializar(graficos.barras_por_grupo(
+        df_filtrado["UF Cliente"],
+        df_filtrado["Preço Médio Venda"],
+        df_filtrado["UF Cliente"],
+        nome_x="UF Cliente",
+        nome_y="Preço Médio Venda",
+        nome_grupo="UF Cliente",
+        titulo=f"Preço médio por estado - Produto {produto}",
+    ))
+
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def figura_heatmap(pivot):
+    # Preços dentro das células (até graficos.LIMITE_CELULAS_COM_TEXTO células) e tooltip personalizado
+    return graficos.serializar(graficos.mapa_de_calor(
+        pivot,
+        titulo="Mapa de calor - Preços por produto e estado",
+        escala_cores="RdBu",
+        hovertemplate="UF: %{x}<br>Produto: %{y}<br>Preço Médio: R$ %{z:.2f}<extra></extra>",
+    ))
+
+
 # ========================
 # 2. Upload do arquivo
 # ========================
@@ -16,6 +57,10 @@ uploaded_file = st.file_uploader("📂 Faça upload do arquivo Excel", type=["xl
 if uploaded_file:
     df = pd.read_excel(uploaded_file)
 
+    # Consultas SQL (DuckDB) sobre a planilha carregada, exposta como a tabela `precos`
+    con = consultas.conectar()
+    con.register("precos", df)
+
     # ========================
     # 3. Filtro de Produto
     # ========================
@@ -29,89 +74,59 @@ if uploaded_file:
     if produto_selecionado == "Todos":
         st.subheader("Produtos mais solicitados em cada Estado")
 
-        # Encontrar o produto mais frequente por estado
-        mais_vendidos = (
-            df.groupby(["UF Cliente", "Produto"])
-            .size()
-            .reset_index(name="Qtde")
-        )
-
-        # Selecionar o mais solicitado de cada estado
-        mais_vendidos = mais_vendidos.loc[
-            mais_vendidos.groupby("UF Cliente")["Qtde"].idxmax()
-        ]
-
-        # Juntar com os preços médios
-        df_merge = df.merge(
-            mais_vendidos[["UF Cliente", "Produto"]],
-            on=["UF Cliente", "Produto"],
-            how="inner"
-        )
-
-        df_group = (
-            df_merge.groupby(["UF Cliente", "Produto"])["Preço Médio Venda"]
-            .mean()
-            .reset_index()
-        )
-
-        fig_bar = px.bar(
-            df_group,
-            x="UF Cliente",
-            y="Preço Médio Venda",
-            color="Produto",
-            barmode="group",
-            title="Preço médio do produto mais solicitado em cada estado"
-        )
-        st.plotly_chart(fig_bar, use_container_width=True)
+        # Produto mais frequente por estado (empate: menor código) e seu preço médio
+        df_group = consultas.consultar(con, """
+            SELECT "UF Cliente", "Produto", "Preço Médio Venda"
+            FROM (
+                SELECT
+                    "UF Cliente",
+                    "Produto",
+                    AVG("Preço Médio Venda") AS "Preço Médio Venda",
+                    ROW_NUMBER() OVER (
+                        PARTITION BY "UF Cliente" ORDER BY COUNT(*) DESC, "Produto"
+                    ) AS posicao
+                FROM precos
+                WHERE "UF Cliente" IS NOT NULL AND "Produto" IS NOT NULL
+                GROUP BY "UF Cliente", "Produto"
+            )
+            WHERE posicao = 1
+            ORDER BY "UF Cliente"
+        """)
+
+        st.plotly_chart(graficos.desserializar(figura_mais_solicitados(df_group)), use_container_width=True)
 
     else:
         # Filtrar os dados para o produto escolhido
         df_filtrado = df[df["Produto"] == produto_selecionado]
 
-        fig_bar = px.bar(
-            df_filtrado,
-            x="UF Cliente",
-            y="Preço Médio Venda",
-            color="UF Cliente",
-            barmode="group",
-            title=f"Preço médio por estado - Produto {produto_selecionado}"
+        st.plotly_chart(
+            graficos.desserializar(figura_precos_produto(df_filtrado, produto_selecionado)),
+            use_container_width=True,
         )
-        st.plotly_chart(fig_bar, use_container_width=True)
 
     # ========================
     # 5. Heatmap de todos os produtos
     # ========================
     st.subheader("Mapa de calor - Preços por produto e estado")
 
-    # Criar tabela pivoteada (Produto x Estado)
-    pivot = df.pivot_table(
+    # Criar tabela pivoteada (Produto x Estado): média calculada em SQL, depois só o reshape
+    precos_medios = consultas.consultar(con, """
+        SELECT "Produto", "UF Cliente", AVG("Preço Médio Venda") AS "Preço Médio Venda"
+        FROM precos
+        WHERE "Preço Médio Venda" IS NOT NULL AND "Produto" IS NOT NULL AND "UF Cliente" IS NOT NULL
+        GROUP BY "Produto", "UF Cliente"
+    """)
+    pivot = precos_medios.pivot(
         index="Produto",
         columns="UF Cliente",
-        values="Preço Médio Venda",
-        aggfunc="mean"
+        values="Preço Médio Venda"
     )
 
     # Converter Produto em string (para aparecer como rótulo no eixo Y)
     pivot.index = pivot.index.astype(str)
 
-    # Criar heatmap com preços dentro das células
-    fig_heatmap = px.imshow(
-        pivot,
-        aspect="auto",
-        color_continuous_scale="RdBu",
-        title="Mapa de calor - Preços por produto e estado",
-        text_auto=True  # mostra valores dentro das células
-    )
-
-    # Forçar eixo Y categórico
-    fig_heatmap.update_yaxes(type="category")
-
-    # Personalizar tooltip
-    fig_heatmap.update_traces(
-        hovertemplate="UF: %{x}<br>Produto: %{y}<br>Preço Médio: R$ %{z:.2f}<extra></extra>"
-    )
-
-    st.plotly_chart(fig_heatmap, use_container_width=True)
+    # Heatmap com eixo Y categórico
+    st.plotly_chart(graficos.desserializar(figura_heatmap(pivot)), use_container_width=True)
 
 else:
     st.info("⬆️ Faça upload de um arquivo Excel para começar.")
\ No newline at end of file
@@ -1,9 +1,19 @@
+import os
 import re
 import pandas as pd
 import streamlit as st
-import plotly.express as px
 from datetime import datetime
 import unicodedata 
+import threading
+import time
+import openpyxl
+import consultas
+import exportacao
+import graficos
+import motores
+import upload
+from cache_agregados import CacheAgregados, chave_filtros
+from classificador_motivos import ClassificadorMotivos
 
 # ----------------------------------------------------
 # Configuração inicial do Streamlit e Layout
@@ -190,16 +200,64 @@ def formatar_quantidade_metrica(numero):
 # -------------------------
 # Funções auxiliares de extração e padronização 
 # -------------------------
-def extrair_produtos(texto):
+
+# Limites de segurança da extração: textos colados de e-mails ou células com milhares
+# de dígitos faziam uma única linha levar segundos (os padrões com \d{5,} são
+# quadráticos no tamanho de uma sequência de dígitos)
+LIMITE_CARACTERES_TEXTO = 5_000 # Caracteres analisados por resposta
+LIMITE_DIGITOS_SEQUENCIA = 20 # Sequências maiores não são código nem quantidade
+LIMITE_ITENS_POR_TEXTO = 200 # Itens extraídos por resposta
+# Correspondências de regex examinadas por resposta. É um limite de passos, e não de
+# tempo: a mesma planilha gera sempre os mesmos itens, com o servidor ocioso ou carregado
+LIMITE_CORRESPONDENCIAS_TEXTO = 2_000
+
+RE_SEQUENCIA_LONGA = re.compile(r"\d{%d,}" % (LIMITE_DIGITOS_SEQUENCIA + 1))
+
+
+def limitar_texto(texto, ocorrencias=None):
+    """
+    Aplica os limites de tamanho ao texto antes da extração. Cada corte feito é
+    descrito em `ocorrencias` (lista), quando informada.
+    """
+    if len(texto) > LIMITE_CARACTERES_TEXTO:
+        texto = texto[:LIMITE_CARACTERES_TEXTO]
+        if ocorrencias is not None:
+            ocorrencias.append(f"texto cortado em {LIMITE_CARACTERES_TEXTO} caracteres")
+
+    texto, removidas = RE_SEQUENCIA_LONGA.subn(" ", texto)
+    if removidas and ocorrencias is not None:
+        ocorrencias.append(f"{removidas} sequência(s) com mais de {LIMITE_DIGITOS_SEQUENCIA} dígitos ignorada(s)")
+
+    return texto
+
+
+def extrair_produtos(texto, ocorrencias=None):
     """
     Extrai código, quantidade e preço de um texto usando diversos padrões,
     com lógica aprimorada para distinguir CÓDIGO (5+ dígitos) de QUANTIDADE 
     e mitigar a atribuição de grandes volumes.
+    O trabalho por texto é limitado (tamanho, itens e correspondências examinadas); os cortes são
+    registrados em `ocorrencias`, quando informada.
     """
     if not isinstance(texto, str):
         return []
 
-    texto = texto.upper()
+    texto = limitar_texto(texto, ocorrencias).upper()
+    correspondencias = 0
+
+    def orcamento_esgotado():
+        nonlocal correspondencias
+        correspondencias += 1
+        if len(resultados) >= LIMITE_ITENS_POR_TEXTO:
+            motivo = f"extração parada em {LIMITE_ITENS_POR_TEXTO} itens"
+        elif correspondencias > LIMITE_CORRESPONDENCIAS_TEXTO:
+            motivo = f"extração parada após {LIMITE_CORRESPONDENCIAS_TEXTO} correspondências"
+        else:
+            return False
+        if ocorrencias is not None and motivo not in ocorrencias:
+            ocorrencias.append(motivo)
+        return True
+
     resultados = []
     codigos_extraidos = set() # Conjunto para rastrear códigos já encontrados
 
@@ -218,7 +276,10 @@ def extrair_produtos(texto):
     LIMITE_QTD_MAXIMA = 5000
 
     for padrao in padroes_com_qtd_separador:
-        for a, b in re.findall(padrao, texto):
+        for encontrado in re.finditer(padrao, texto):
+            if orcamento_esgotado():
+                break
+            a, b = encontrado.groups()
             
             # --- LÓGICA DE DEFINIÇÃO DE CÓDIGO E QUANTIDADE ---
             cod, qtd_str = None, None
@@ -248,9 +309,10 @@ def extrair_produtos(texto):
 
     # --- REGEX 2: CÓDIGOS SOLTOS (5+ dígitos, sem quantidade clara) ---
     # Só adiciona se o código NÃO foi encontrado com quantidade explícita antes
-    produtos_soltos = re.findall(r"\b\d{5,}\b", texto)
-    for cod in produtos_soltos:
-        cod_padronizado = padronizar_produto(cod)
+    for encontrado in re.finditer(r"\b\d{5,}\b", texto):
+        if orcamento_esgotado():
+            break
+        cod_padronizado = padronizar_produto(encontrado.group())
         
         if cod_padronizado not in codigos_extraidos:
             # Adiciona com quantidade 1 como padrão
@@ -259,9 +321,12 @@ def extrair_produtos(texto):
 
 
     # --- REGEX 3: EXTRAÇÃO DE PREÇOS (Opcional) ---
-    precos = re.findall(r"R\$\s?([\d.,]+)", texto)
     precos_convertidos = []
-    for p in precos:
+    for encontrado in re.finditer(r"R\$\s?([\d.,]+)", texto):
+        # Só os primeiros preços são associados a itens; o resto não precisa ser lido
+        if len(precos_convertidos) >= len(resultados):
+            break
+        p = encontrado.group(1)
         try:
             # Converte R$ 1.234,56 para 1234.56
             precos_convertidos.append(float(p.replace(".", "").replace(",", ".")))
@@ -365,56 +430,53 @@ def padronizar_produto(prod):
 
     return prod.strip()
 
+# Categorias e palavras-chave do Motivo Agrupado (edite o arquivo para criar/ajustar categorias)
+ARQUIVO_REGRAS_MOTIVOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "regras_motivos.json")
+CLASSIFICADOR_MOTIVOS = ClassificadorMotivos.de_arquivo(ARQUIVO_REGRAS_MOTIVOS)
+
+MOTIVO_NAO_INFORMADO = 'Não Informado'
+
 def padronizar_motivo(motivo):
     """Agrupa variações de motivos de negociação em categorias mais amplas."""
     if not isinstance(motivo, str):
-        return 'Não Informado'
+        return MOTIVO_NAO_INFORMADO
     motivo = motivo.strip().lower()
     if not motivo:
-        return 'Não Informado'
+        return MOTIVO_NAO_INFORMADO
 
-    # Agrupamento de motivos 
-    
-    if 'desconto' in motivo or 'promocao' in motivo or 'solicitou desconto' in motivo:
-        return 'Solicitou Desconto / Promoção'
-        
-    if 'volume' in motivo or 'quantidade' in motivo or 'aumentar' in motivo or 'quer preco para quantidade' in motivo:
-        return 'Aumento Volume / Quantidade'
-        
-    if 'negociacao' in motivo or 'melhorar' in motivo or 'melhores condicoes' in motivo or 'preço' in motivo or 'preco' in motivo or 'cliente pedido negociacao' in motivo or 'cliente pedido p melhorar' in motivo:
-        return 'Negociação / Melhor Condição de Preço'
-        
-    if 'pagou' in motivo or 'ultima vez' in motivo:
-        return 'Cliente Pagou da Última Vez'
-    if 'manter' in motivo or 'manter os valores' in motivo or 'cliente pedindo para manter os valores' in motivo:
-        return 'Manter Valores'
-    if 'solicitou' in motivo or 'pedido' in motivo or 'cliente solicitou' in motivo or 'cliente pediu' in motivo:
-        return 'Outra Solicitação do Cliente'
+    # Sem categoria nas regras: mantém o próprio motivo, formatado
+    return CLASSIFICADOR_MOTIVOS.classificar_texto(motivo) or formatar_texto(motivo)
 
-    return formatar_texto(motivo)
+# Padronizações aplicadas pelo motor de dados: {coluna de destino: (coluna de origem, função por valor)}
+PADRONIZACOES = {
+    "Produto": ("Produto", padronizar_produto),
+    "Estado": ("Estado", padronizar_estado),
+    "Solicitante": ("Solicitante", padronizar_solicitante),
+    "Motivo_Agrupado": ("Motivo", padronizar_motivo),
+}
 
 # ------------------------------------
 # Função de Carregamento e Tratamento (Com Cache e Spinner)
 # ------------------------------------
 
-@st.cache_data
-def load_data(arquivo):
-    """
-    Carrega o arquivo, trata e padroniza os dados.
-    Esta função usa o cache para evitar reprocessamento desnecessário.
-    """
-    try:
-        # Tenta carregar a aba correta
-        df = pd.read_excel(arquivo, sheet_name="Respostas do Formulário 1")
-    except ValueError:
-        st.error("Erro: A planilha 'Respostas do Formulário 1' não foi encontrada. Verifique o nome da aba.")
-        return pd.DataFrame() 
-    except Exception as e:
-        st.error(f"Erro ao carregar o arquivo: {e}")
-        return pd.DataFrame()
+# Motor de dados do tratamento: "pandas" (padrão) ou "polars" (multi-thread),
+# escolhido pela variável de ambiente ANALISTA_MOTOR_DADOS
+MOTOR_DADOS = motores.obter_motor(os.environ.get("ANALISTA_MOTOR_DADOS", motores.MOTOR_PADRAO))
+
+class ErroPlanilha(Exception):
+    """Erro de leitura/estrutura da planilha, com a mensagem pronta para exibição."""
+
+    def __init__(self, mensagem, nivel="error"):
+        super().__init__(mensagem)
+        self.mensagem = mensagem
+        self.nivel = nivel # "error" ou "warning", conforme o st.* usado para exibir
 
-    df.columns = df.columns.str.strip()
 
+def identificar_colunas(nomes_colunas):
+    """
+    Identifica as colunas usadas no tratamento a partir dos nomes do cabeçalho.
+    Levanta ErroPlanilha se não houver coluna de texto para a extração.
+    """
     # Mapeamento de Colunas (para maior flexibilidade e evitar KeyError)
     # A coluna de data de formulários do Google/Microsoft é frequentemente "Carimbo de data/hora"
     coluna_data = "Carimbo de data/hora" 
@@ -425,369 +487,978 @@ def load_data(arquivo):
     coluna_motivo = "MOTIVO:"
     
     # Verifica a existência das colunas
-    coluna_data = coluna_data if coluna_data in df.columns else (
-        "Data" if "Data" in df.columns else None
-    )
-    coluna_produto_preco = coluna_produto_preco if coluna_produto_preco in df.columns else None
-    coluna_analise = coluna_analise if coluna_analise in df.columns else None
-    coluna_estado = coluna_estado if coluna_estado in df.columns else None
-    coluna_solicitante = coluna_solicitante if coluna_solicitante in df.columns else None
-    coluna_motivo = coluna_motivo if coluna_motivo in df.columns else None
+    colunas = {
+        "data": coluna_data if coluna_data in nomes_colunas else (
+            "Data" if "Data" in nomes_colunas else None
+        ),
+        "produto_preco": coluna_produto_preco if coluna_produto_preco in nomes_colunas else None,
+        "analise": coluna_analise if coluna_analise in nomes_colunas else None,
+        "estado": coluna_estado if coluna_estado in nomes_colunas else None,
+        "solicitante": coluna_solicitante if coluna_solicitante in nomes_colunas else None,
+        "motivo": coluna_motivo if coluna_motivo in nomes_colunas else None,
+    }
 
     # Se a coluna principal de extração não existir, emite um aviso e interrompe
-    if not (coluna_produto_preco or coluna_analise):
-        st.warning("Não foi possível encontrar as colunas de texto para extração (ex: 'CODIGO DO PRODUTO, QUANTIDADE E PREÇO SOLICITADO:'). Verifique o nome das colunas.")
-        return pd.DataFrame()
-    
-    dados_tratados = []
+    if not (colunas["produto_preco"] or colunas["analise"]):
+        raise ErroPlanilha(
+            "Não foi possível encontrar as colunas de texto para extração (ex: 'CODIGO DO PRODUTO, QUANTIDADE E PREÇO SOLICITADO:'). Verifique o nome das colunas.",
+            nivel="warning",
+        )
 
-    for index, row in df.iterrows():
-        # Combina as duas colunas de texto para maximizar a extração
-        texto_produtos = str(row.get(coluna_produto_preco, "")) + " " + str(row.get(coluna_analise, ""))
-        
-        produtos_extraidos = extrair_produtos(texto_produtos)
-        campos_extras = extrair_campos(texto_produtos)
-
-        # Prioriza colunas diretas da planilha, depois a extração do texto
-        estado = formatar_texto(row.get(coluna_estado, None)) or campos_extras.get('Estado')
-        solicitante = formatar_texto(row.get(coluna_solicitante, None)) or campos_extras.get('Solicitante')
-        motivo = formatar_texto(row.get(coluna_motivo, None)) or campos_extras.get('Motivo')
-
-        for produto, qtd, preco in produtos_extraidos:
-            dados_tratados.append({
-                "Data": row.get(coluna_data, None), 
-                "Produto": str(produto).strip() if produto else None,
-                "Quantidade": qtd if qtd is not None else 1,
-                "Preco_Solicitado": preco,
-                "Estado": estado,
-                "Solicitante": solicitante,
-                "Motivo": motivo,
-                "Contagem_Solicitacao": 1, 
-            })
-
-    df_tratado = pd.DataFrame(dados_tratados)
-
-    # Limpeza e criação de colunas de tempo
-    df_tratado["Data"] = pd.to_datetime(df_tratado["Data"], errors="coerce")
-    df_tratado = df_tratado.dropna(subset=["Data"]) # Remove linhas sem data válida
-
-    df_tratado["Data_Dia"] = df_tratado["Data"].dt.strftime("%Y-%m-%d") 
-    df_tratado["AnoMes"] = df_tratado["Data"].dt.to_period("M").astype(str)
-    df_tratado["AnoSemana"] = df_tratado["Data"].dt.strftime("%Y-%W") 
-
-    # Filtragem de dados nulos/inválidos de Produto
-    df_tratado = df_tratado.dropna(subset=["Produto"])
-    df_tratado = df_tratado[df_tratado["Produto"].str.lower() != "none"]
-
-    # Ajuste: Garantir que Quantidade é um número inteiro ANTES DA AGREGAÇÃO
-    df_tratado["Quantidade"] = pd.to_numeric(df_tratado["Quantidade"], errors='coerce').fillna(0).astype(int) 
-
-    # Padronização
-    df_tratado["Produto"] = df_tratado["Produto"].apply(padronizar_produto)
-    df_tratado["Estado"] = df_tratado["Estado"].apply(padronizar_estado)
-    df_tratado["Solicitante"] = df_tratado["Solicitante"].apply(padronizar_solicitante)
-    df_tratado["Motivo_Agrupado"] = df_tratado["Motivo"].apply(padronizar_motivo)
+    return colunas
+
+
+def ler_planilha_em_lotes(arquivo, tamanho_lote):
+    """
+    Lê a aba de respostas linha a linha (openpyxl em modo read_only) e entrega
+    DataFrames de até `tamanho_lote` linhas (como os do pd.read_excel), para o
+    tratamento começar antes de o Excel inteiro ser carregado.
+    Retorna (colunas, total_linhas, lotes); total_linhas pode ser None se a planilha
+    não informar suas dimensões.
+    """
+    try:
+        wb = openpyxl.load_workbook(arquivo, read_only=True, data_only=True)
+    except Exception as e:
+        raise ErroPlanilha(f"Erro ao carregar o arquivo: {e}")
+
+    if "Respostas do Formulário 1" not in wb.sheetnames:
+        wb.close()
+        raise ErroPlanilha("Erro: A planilha 'Respostas do Formulário 1' não foi encontrada. Verifique o nome da aba.")
+
+    ws = wb["Respostas do Formulário 1"]
+    linhas = ws.iter_rows(values_only=True)
+    cabecalho = next(linhas, None) or ()
+    # Mesmos nomes que o pd.read_excel daria ao cabeçalho
+    nomes_colunas = pd.Index([
+        str(nome).strip() if nome is not None else f"Unnamed: {i}"
+        for i, nome in enumerate(cabecalho)
+    ])
+
+    try:
+        colunas = identificar_colunas(nomes_colunas)
+    except ErroPlanilha:
+        wb.close()
+        raise
+
+    total_linhas = ws.max_row - 1 if ws.max_row else None
+
+    def lotes():
+        try:
+            lote = []
+            for linha in linhas:
+                lote.append(linha[:len(nomes_colunas)])
+                if len(lote) == tamanho_lote:
+                    yield _montar_lote(lote, nomes_colunas)
+                    lote = []
+            if lote:
+                yield _montar_lote(lote, nomes_colunas)
+        finally:
+            wb.close()
+
+    return colunas, total_linhas, lotes()
+
+
+def _montar_lote(linhas, nomes_colunas):
+    """Converte as linhas cruas do openpyxl num DataFrame equivalente ao do pd.read_excel (células vazias como NaN)."""
+    lote = pd.DataFrame(list(linhas), columns=nomes_colunas)
+    return lote.mask(lote.isna())
+
+
+def linha_planilha(posicao):
+    """Número da linha no Excel da resposta na `posicao` (0 = primeira linha de dados)."""
+    # +2: o Excel numera a partir de 1 e a primeira linha é o cabeçalho
+    return posicao + 2
+
+
+def texto_resposta(row, colunas):
+    """Texto de uma resposta usado na extração."""
+    # Combina as duas colunas de texto para maximizar a extração
+    return str(row.get(colunas["produto_preco"], "")) + " " + str(row.get(colunas["analise"], ""))
+
+
+def tratar_linha(row, colunas, ocorrencias=None, linha=None):
+    """
+    Extrai os itens de uma resposta do formulário (uma linha da planilha).
+    Os cortes feitos pelos limites de extração vão para `ocorrencias` (lista), quando informada.
+    `linha` (número da linha no Excel) vai em cada item, ligando-o à resposta original.
+    """
+    texto_produtos = limitar_texto(texto_resposta(row, colunas), ocorrencias)
     
-    # Cálculo do Valor Total do Item
-    df_tratado["Valor_Total_Item"] = df_tratado["Quantidade"] * df_tratado["Preco_Solicitado"]
+    produtos_extraidos = extrair_produtos(texto_produtos, ocorrencias)
+    campos_extras = extrair_campos(texto_produtos)
+
+    # Prioriza colunas diretas da planilha, depois a extração do texto
+    estado = formatar_texto(row.get(colunas["estado"], None)) or campos_extras.get('Estado')
+    solicitante = formatar_texto(row.get(colunas["solicitante"], None)) or campos_extras.get('Solicitante')
+    motivo = formatar_texto(row.get(colunas["motivo"], None)) or campos_extras.get('Motivo')
+
+    itens = []
+    for produto, qtd, preco in produtos_extraidos:
+        itens.append({
+            "Data": row.get(colunas["data"], None), 
+            "Produto": str(produto).strip() if produto else None,
+            "Quantidade": qtd if qtd is not None else 1,
+            "Preco_Solicitado": preco,
+            "Estado": estado,
+            "Solicitante": solicitante,
+            "Motivo": motivo,
+            "Contagem_Solicitacao": 1, 
+            "Linha_Planilha": linha,
+        })
+    return itens
+
+
+def extrair_lote(df_lote, colunas, primeira_posicao):
+    """
+    Extrai os itens de um lote de respostas do ler_planilha_em_lotes, cuja primeira
+    linha está na `primeira_posicao` (0 = primeira linha de dados).
+    Retorna (itens, respostas, linhas_truncadas): os itens extraídos, os pares
+    (linha, texto) das respostas que geraram itens e as entradas do relatório de truncamento.
+    """
+    itens = []
+    respostas = []
+    linhas_truncadas = []
+    for posicao, (index, row) in enumerate(df_lote.iterrows(), start=primeira_posicao):
+        ocorrencias = []
+        itens_resposta = tratar_linha(row, colunas, ocorrencias, linha_planilha(posicao))
+        if itens_resposta:
+            itens.extend(itens_resposta)
+            respostas.append((linha_planilha(posicao), texto_resposta(row, colunas)))
+        if ocorrencias:
+            linhas_truncadas.append(registro_truncamento(posicao, ocorrencias))
+    return itens, respostas, linhas_truncadas
+
+
+def montar_respostas(respostas):
+    """DataFrame (Linha_Planilha, Resposta) com os textos originais das respostas, a partir de pares (linha, texto)."""
+    return pd.DataFrame(respostas, columns=["Linha_Planilha", "Resposta"]).astype({"Linha_Planilha": "int64"})
+
+
+def tratar_itens(itens):
+    """
+    Monta o DataFrame tratado a partir dos itens extraídos (limpeza, colunas de tempo e padronização).
+    O trabalho é feito pelo motor de dados configurado (pandas ou Polars); o resultado é sempre pandas.
+    """
+    return MOTOR_DADOS.finalizar_tratamento(itens, PADRONIZACOES)
+
+
+def juntar_lotes(lotes_tratados):
+    """Concatena os DataFrames já tratados de cada lote (sem tratar nada de novo)."""
+    lotes_tratados = [df_lote for df_lote in lotes_tratados if not df_lote.empty]
+    if not lotes_tratados:
+        return pd.DataFrame()
+    return pd.concat(lotes_tratados, ignore_index=True)
+
+
+def finalizar_tratamento(lotes_tratados):
+    """DataFrame tratado da planilha inteira, a partir dos lotes tratados, com o relatório de motivos."""
+    df_tratado = juntar_lotes(lotes_tratados)
+    if df_tratado.empty:
+        return df_tratado
+
+    return anexar_relatorio_motivos(df_tratado)
+
+
+# Quantidade de linhas truncadas guardadas no relatório (o total é sempre contado)
+LIMITE_RELATORIO_TRUNCAMENTO = 500
+
+def registro_truncamento(posicao, ocorrencias):
+    """Entrada do relatório de truncamento para a resposta na `posicao` (0 = primeira linha de dados)."""
+    return {"Linha da Planilha": linha_planilha(posicao), "Ocorrências": "; ".join(ocorrencias)}
+
+
+def anexar_relatorio_truncamento(df_tratado, linhas_truncadas):
+    """
+    Guarda o relatório de respostas truncadas em df_tratado.attrs (que vai junto
+    para o cache Parquet), limitado a LIMITE_RELATORIO_TRUNCAMENTO entradas.
+    """
+    df_tratado.attrs["total_linhas_truncadas"] = len(linhas_truncadas)
+    df_tratado.attrs["linhas_truncadas"] = linhas_truncadas[:LIMITE_RELATORIO_TRUNCAMENTO]
+    return df_tratado
+
 
+# Quantidade de motivos sem categoria listados no relatório (o total é sempre contado)
+LIMITE_RELATORIO_MOTIVOS = 500
+
+def anexar_relatorio_motivos(df_tratado):
+    """
+    Guarda em df_tratado.attrs os motivos que nenhuma regra do arquivo de regras
+    classificou (do mais para o menos frequente), para ajustar as palavras-chave.
+    """
+    # Sem categoria: o Motivo_Agrupado é o próprio motivo formatado
+    categorias = CLASSIFICADOR_MOTIVOS.categorias + [MOTIVO_NAO_INFORMADO]
+    sem_categoria = df_tratado["Motivo_Agrupado"].notna() & ~df_tratado["Motivo_Agrupado"].isin(categorias)
+    motivos_sem_categoria = df_tratado.loc[sem_categoria, "Motivo_Agrupado"].value_counts()
+
+    df_tratado.attrs["total_motivos_sem_categoria"] = len(motivos_sem_categoria)
+    df_tratado.attrs["motivos_sem_categoria"] = [
+        {"Motivo": motivo, "Itens": int(itens)}
+        for motivo, itens in motivos_sem_categoria.head(LIMITE_RELATORIO_MOTIVOS).items()
+    ]
     return df_tratado
 
+
+# ------------------------------------
+# Processamento em Segundo Plano (Dashboard Progressivo)
+# ------------------------------------
+
+# Versão do tratamento gravada na chave do cache Parquet: incremente ao mudar a
+# extração/padronização para que planilhas já tratadas sejam reprocessadas
+VERSAO_TRATAMENTO = 4
+
+class ProcessamentoPlanilha:
+    """
+    Executa o tratamento da planilha numa thread, em lotes de linhas, para que
+    o dashboard seja desenhado com os lotes já concluídos enquanto o restante
+    da planilha é processado.
+    """
+
+    TAMANHO_LOTE = 500 # Linhas da planilha por lote
+    # Sem nenhuma execução do app pedindo o resultado por este tempo (segundos), a
+    # sessão foi fechada: o processamento é cancelado em vez de seguir até o fim
+    TEMPO_SEM_ACESSO = 60
+
+    def __init__(self, arquivo, chave):
+        self._arquivo = arquivo
+        # Identifica o arquivo no cache Parquet (mudar as regras de motivos também reprocessa)
+        self.chave = f"{chave}_v{VERSAO_TRATAMENTO}_{CLASSIFICADOR_MOTIVOS.versao}"
+        self._lock = threading.Lock()
+        self._lotes_tratados = [] # Um DataFrame tratado por lote: cada lote é tratado uma única vez
+        self._linhas_truncadas = []
+        self._respostas = [] # (linha, texto) das respostas que geraram itens
+        self._parcial = None # (linhas_processadas, df) do último resultado parcial montado
+        self._respostas_parciais = None # (linhas_processadas, df) dos textos do último resultado parcial
+        self.linhas_processadas = 0
+        self.total_linhas = None # Desconhecido até o Excel ser aberto
+        self.erro = None # ErroPlanilha, se a leitura falhar
+        self.df_final = None
+        self.df_respostas = None
+        self.caminho_parquet = None
+        self.concluido = False
+        self._cancelamento = threading.Event()
+        self._ultimo_acesso = time.monotonic()
+        self._thread = threading.Thread(target=self._executar, daemon=True)
+
+    def iniciar(self):
+        self._thread.start()
+        return self
+
+    def cancelar(self):
+        """Pede à thread que pare no próximo lote (ex.: outro arquivo foi carregado na sessão)."""
+        self._cancelamento.set()
+
+    @property
+    def cancelado(self):
+        return self._cancelamento.is_set()
+
+    def _interromper(self):
+        """True se o processamento foi cancelado ou se a sessão parou de pedir o resultado."""
+        if time.monotonic() - self._ultimo_acesso > self.TEMPO_SEM_ACESSO:
+            self.cancelar()
+        return self.cancelado
+
+    def _executar(self):
+        # Atenção: nenhuma chamada st.* aqui, a thread não tem contexto de script do Streamlit
+        try:
+            # Mesma planilha já tratada (nesta ou em outra sessão): usa o Parquet em cache
+            caminho_parquet = consultas.caminho_em_cache(self.chave)
+            if caminho_parquet:
+                df_final = pd.read_parquet(caminho_parquet)
+                caminho_respostas = consultas.caminho_em_cache(f"{self.chave}_respostas")
+                df_respostas = pd.read_parquet(caminho_respostas) if caminho_respostas else montar_respostas([])
+                with self._lock:
+                    self.df_respostas = df_respostas
+                    self.df_final = df_final
+                    self.caminho_parquet = caminho_parquet
+                return
+
+            colunas, self.total_linhas, lotes = ler_planilha_em_lotes(self._arquivo, self.TAMANHO_LOTE)
+
+            for df_lote in lotes:
+                if self._interromper():
+                    return # Sem Parquet: o cache só recebe planilhas processadas até o fim
+                itens, respostas, linhas_truncadas = extrair_lote(df_lote, colunas, self.linhas_processadas)
+                df_lote_tratado = tratar_itens(itens)
+                self._linhas_truncadas.extend(linhas_truncadas)
+                with self._lock:
+                    self._lotes_tratados.append(df_lote_tratado)
+                    self._respostas.extend(respostas)
+                    self.linhas_processadas += len(df_lote)
+
+            df_final = anexar_relatorio_truncamento(
+                finalizar_tratamento(self._lotes_tratados), self._linhas_truncadas
+            )
+            df_respostas = montar_respostas(self._respostas)
+            with self._lock:
+                self.df_respostas = df_respostas
+                self.df_final = df_final
+
+            # Cache Parquet para as consultas SQL; se a gravação falhar, as consultas leem o DataFrame.
+            # Os textos são gravados antes: o Parquet dos itens indica que o cache está completo
+            if not df_final.empty:
+                try:
+                    consultas.salvar_parquet(df_respostas, f"{self.chave}_respostas", ordenar_por="Linha_Planilha")
+                    self.caminho_parquet = consultas.salvar_parquet(df_final, self.chave)
+                    consultas.limpar_cache(manter={self.chave})
+                except Exception:
+                    self.caminho_parquet = None
+        except ErroPlanilha as e:
+            self.erro = e
+        except Exception as e:
+            self.erro = ErroPlanilha(f"Erro ao processar o arquivo: {e}")
+        finally:
+            self._arquivo = None # Libera o conteúdo do upload
+            self.concluido = True
+
+    def progresso(self):
+        """Fração (0 a 1) das linhas da planilha já processadas."""
+        if self.concluido:
+            return 1.0
+        if not self.total_linhas:
+            return 0.0
+        return min(self.linhas_processadas / self.total_linhas, 1.0)
+
+    def resultado(self):
+        """DataFrame final, ou os lotes tratados até agora (concatenados, sem tratar de novo)."""
+        self._ultimo_acesso = time.monotonic()
+        if self.df_final is not None:
+            return self.df_final
+
+        with self._lock:
+            linhas = self.linhas_processadas
+            if self._parcial is not None and self._parcial[0] == linhas:
+                return self._parcial[1]
+            lotes_tratados = list(self._lotes_tratados)
+
+        df_parcial = juntar_lotes(lotes_tratados)
+        self._parcial = (linhas, df_parcial)
+        return df_parcial
+
+    def respostas(self):
+        """Textos originais das respostas que geraram itens (as já processadas, enquanto não termina)."""
+        if self.df_respostas is not None:
+            return self.df_respostas
+
+        with self._lock:
+            linhas = self.linhas_processadas
+            if self._respostas_parciais is not None and self._respostas_parciais[0] == linhas:
+                return self._respostas_parciais[1]
+            respostas = list(self._respostas)
+
+        df_respostas = montar_respostas(respostas)
+        self._respostas_parciais = (linhas, df_respostas)
+        return df_respostas
+
 # -------------------------
-# App principal
+# Dashboard
 # -------------------------
-def main():
-    st.title("📦📈 Dashboard Estratégico de Solicitações de Produtos")
-    
+INTERVALO_ATUALIZACAO = 1.0 # Segundos entre as atualizações do dashboard parcial
+
+def aguardar_processamento():
+    """Aguarda um intervalo curto e reexecuta o app para atualizar o dashboard parcial."""
+    time.sleep(INTERVALO_ATUALIZACAO)
+    st.rerun()
+
+
+def exibir_relatorio_truncamento(df_tratado):
+    """Lista as respostas em que a extração foi limitada (texto longo, sequências de dígitos, correspondências)."""
+    total = df_tratado.attrs.get("total_linhas_truncadas", 0)
+    if not total:
+        return
+
+    with st.expander(f"⚠️ {total} resposta(s) analisada(s) apenas parcialmente"):
+        limite_caracteres = f"{LIMITE_CARACTERES_TEXTO:,}".replace(",", ".")
+        limite_correspondencias = f"{LIMITE_CORRESPONDENCIAS_TEXTO:,}".replace(",", ".")
+        st.caption(
+            f"Por segurança, cada resposta tem no máximo {limite_caracteres} caracteres analisados, "
+            f"sequências com mais de {LIMITE_DIGITOS_SEQUENCIA} dígitos são ignoradas e a extração para em "
+            f"{LIMITE_ITENS_POR_TEXTO} itens ou {limite_correspondencias} correspondências examinadas. "
+            "Confira as linhas abaixo na planilha original."
+        )
+        linhas_truncadas = df_tratado.attrs["linhas_truncadas"]
+        if total > len(linhas_truncadas):
+            st.caption(f"Exibindo as primeiras {len(linhas_truncadas)} de {total} respostas.")
+        st.dataframe(pd.DataFrame(linhas_truncadas), hide_index=True, use_container_width=True)
+
+
+# -------------------------
+# Configuração de Template do Plotly
+# -------------------------
+PLOTLY_TEMPLATE = "plotly_dark"
+
+# Definição de Cores
+COLOR_VOLUME = '#1f77b4' # Azul corporativo
+COLOR_FREQUENCIA = '#ff7f0e' # Laranja para contraste
+COLOR_SOLICITANTE = '#2ca02c' # Verde
+COLOR_MOTIVO = '#d62728' # Vermelho/Tijolo
+
+
+def formatar_inteiro(numero):
+    """Inteiro com separador de milhar brasileiro (Ex: 12.345)."""
+    return f"{numero:,.0f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+
+def figura_top_produtos_volume(top_produtos_volume):
+    return graficos.barras(
+        top_produtos_volume["Produto"],
+        top_produtos_volume["Quantidade Total"],
+        nome_x="Produto",
+        nome_y="Quantidade Total",
+        titulo="Top 10 Produtos por Volume de Itens",
+        cor=COLOR_VOLUME,
+        # Formatação: Usa a função formatar_quantidade_metrica para exibir o valor em K/M/B
+        texto=top_produtos_volume["Quantidade Total"].map(formatar_quantidade_metrica),
+        eixo_x={"title": {"text": "Produto (Códigos)"}},
+        eixo_y={"tickformat": ".2s", "title": {"text": "Quantidade Total (Mil/Milhão)"}},
+        template=PLOTLY_TEMPLATE,
+    )
+
+
+def figura_top_produtos_frequencia(top_produtos_contagem):
+    return graficos.barras(
+        top_produtos_contagem["Produto"],
+        top_produtos_contagem["Contagem de Solicitações"],
+        nome_x="Produto",
+        nome_y="Contagem de Solicitações",
+        titulo="Top 10 Produtos por Frequência de Solicitação",
+        cor=COLOR_FREQUENCIA,
+        # Formatação: Exibe o número inteiro da contagem (Ex: 5), com separador de milhar se > 1000
+        texto=top_produtos_contagem["Contagem de Solicitações"].map(formatar_inteiro),
+        eixo_x={"title": {"text": "Produto (Códigos)"}},
+        eixo_y={"tickformat": ",.", "title": {"text": "Número de Solicitações"}},
+        template=PLOTLY_TEMPLATE,
+    )
+
+
+def figura_top_solicitantes(solicitantes_contagem):
+    return graficos.barras(
+        solicitantes_contagem["Contagem"],
+        solicitantes_contagem["Solicitante"],
+        nome_x="Contagem",
+        nome_y="Solicitante",
+        titulo="Top 15 Solicitantes",
+        cor=COLOR_SOLICITANTE,
+        texto=solicitantes_contagem["Contagem"].map(formatar_quantidade_metrica),
+        horizontal=True,
+        # Mantém tickformat compacto para o Plotly cuidar do eixo
+        eixo_x={"tickformat": ".2s", "title": {"text": "Número de Solicitações (Mil/Milhão)"}},
+        eixo_y={"categoryorder": "total ascending"},
+        template=PLOTLY_TEMPLATE,
+    )
+
+
+def figura_motivos(motivos_contagem):
+    top_motivos = motivos_contagem.head(10)
+    return graficos.barras(
+        top_motivos["Motivo_Agrupado"],
+        top_motivos["Contagem"],
+        nome_x="Motivo_Agrupado",
+        nome_y="Contagem",
+        titulo="Top 10 Motivos",
+        cor=COLOR_MOTIVO,
+        # Formatação: Exibe o número inteiro da contagem, com separador de milhar se > 1000
+        texto=top_motivos["Contagem"].map(formatar_inteiro),
+        eixo_x={"title": {"text": "Motivo Agrupado"}, "categoryorder": "total descending"},
+        eixo_y={"tickformat": ",.", "title": {"text": "Número de Solicitações"}},
+        template=PLOTLY_TEMPLATE,
+    )
+
+
+# -------------------------
+# Cache de Agregações (por planilha e estado dos filtros)
+# -------------------------
+LIMITE_CACHE_AGREGADOS_BYTES = 32 * 1024 * 1024 # Por planilha
+MAXIMO_PLANILHAS_EM_CACHE = 8
+
+@st.cache_resource(max_entries=MAXIMO_PLANILHAS_EM_CACHE, show_spinner=False)
+def obter_cache_agregados(chave_dataset):
+    """
+    Cache LRU das agregações de uma planilha (chave = digest do upload + versão do
+    tratamento), compartilhado entre as sessões que carregaram a mesma planilha.
+    """
+    return CacheAgregados(LIMITE_CACHE_AGREGADOS_BYTES)
+
+
+def memorizar(cache, chave, calcular):
+    """Usa o cache quando existe; no dashboard parcial (cache None) sempre recalcula."""
+    if cache is None:
+        return calcular()
+    return cache.obter_ou_calcular(chave, calcular)
+
+
+def calcular_opcoes_filtros(con):
+    """Período dos dados e opções dos filtros secundários (não dependem da seleção)."""
+    return {
+        "periodo": consultas.periodo(con),
+        "produtos": consultas.valores_distintos(con, "Produto"),
+        "solicitantes": consultas.valores_distintos(con, "Solicitante"),
+        "motivos": consultas.valores_distintos(con, "Motivo_Agrupado"),
+    }
+
+
+def calcular_opcoes_estado(con, filtros):
+    """Total de solicitações com os filtros secundários e os estados disponíveis neles."""
+    return {
+        "total_solicitacoes": consultas.metricas(con, filtros)["total_solicitacoes"],
+        "estados": consultas.valores_distintos(con, "Estado", filtros),
+    }
+
+
+def calcular_visao(con, filtros):
+    """
+    Tudo o que o dashboard desenha para um estado dos filtros: totais dos cards,
+    tabelas agregadas dos gráficos e as figuras já serializadas em JSON.
+    """
+    totais = consultas.metricas(con, filtros)
+    if totais["total_solicitacoes"] == 0:
+        return {"totais": totais, "tabelas": {}, "figuras": {}}
+
+    tabelas = {
+        # Volume: SOMA da coluna Quantidade; Frequência: CONTAGEM de linhas (solicitações)
+        "top_produtos_volume": consultas.top_produtos_volume(con, filtros, limite=10),
+        "top_produtos_frequencia": consultas.top_produtos_frequencia(con, filtros, limite=10),
+        # Ordenados ascendentemente para que o gráfico de barras horizontais fique do maior para o menor
+        "top_solicitantes": consultas.top_solicitantes(con, filtros, limite=15),
+        "motivos": consultas.contagem_motivos(con, filtros),
+    }
+    figuras = {
+        "top_produtos_volume": figura_top_produtos_volume(tabelas["top_produtos_volume"]),
+        "top_produtos_frequencia": figura_top_produtos_frequencia(tabelas["top_produtos_frequencia"]),
+        "top_solicitantes": figura_top_solicitantes(tabelas["top_solicitantes"]),
+        "motivos": figura_motivos(tabelas["motivos"]),
+    }
+    return {
+        "totais": totais,
+        "tabelas": tabelas,
+        "figuras": {nome: graficos.serializar(fig) for nome, fig in figuras.items()},
+    }
+
+
+def exibir_grafico(visao, nome):
+    """Desenha uma figura serializada da visão e o botão de exportação da sua tabela."""
+    st.plotly_chart(graficos.desserializar(visao["figuras"][nome]), use_container_width=True)
+    tabela = visao["tabelas"][nome]
+    exibir_exportacao("Exportar tabela", nome, lambda: exportacao.tabela_para_lotes(tabela), lambda: len(tabela))
+
+
+def exibir_relatorio_motivos(df_tratado):
+    """Lista os motivos que ficaram fora das categorias do arquivo de regras."""
+    total = df_tratado.attrs.get("total_motivos_sem_categoria", 0)
+    if not total:
+        return
+
+    with st.expander(f"📝 {total} motivo(s) sem categoria"):
+        st.caption(
+            "Estes motivos não contêm nenhuma palavra-chave das categorias e aparecem no dashboard como foram "
+            f"digitados. Para agrupá-los, inclua palavras-chave em `{os.path.basename(ARQUIVO_REGRAS_MOTIVOS)}`."
+        )
+        motivos_sem_categoria = df_tratado.attrs["motivos_sem_categoria"]
+        if total > len(motivos_sem_categoria):
+            st.caption(f"Exibindo os {len(motivos_sem_categoria)} mais frequentes de {total} motivos.")
+        st.dataframe(pd.DataFrame(motivos_sem_categoria), hide_index=True, use_container_width=True)
+
+
+def exibir_dashboard(df_tratado, caminho_parquet=None, chave_dataset=None, respostas=None):
+    """
+    Filtros, métricas e gráficos calculados sobre os dados tratados.
+    As agregações são consultas SQL (módulo consultas) sobre o cache Parquet,
+    quando já gravado, ou diretamente sobre o DataFrame (dashboard parcial).
+    Com `chave_dataset` (planilha totalmente processada), os resultados de cada
+    estado dos filtros ficam no cache de agregações: voltar a uma combinação já
+    vista não refaz consultas nem gráficos.
+    `respostas` são os textos originais das respostas, exibidos no explorador de itens.
+    """
+    con = consultas.conectar(df_tratado, caminho_parquet, respostas)
+    cache = obter_cache_agregados(chave_dataset) if chave_dataset else None
+
     # -------------------------
-    # LAYOUT DE FILTRO PRINCIPAL (Estado)
+    # Filtros Interativos (Sidebar)
     # -------------------------
-    st.markdown("---") # Linha divisória
-    
-    # Carregador de Arquivo
-    arquivo = st.file_uploader("Carregue a planilha Excel", type=["xlsx"], help="A planilha deve conter os dados de resposta do formulário.")
-    
-    st.markdown("---") # Linha divisória
+    st.sidebar.header("Filtros de Análise Secundários")
+    opcoes = memorizar(cache, ("opcoes",), lambda: calcular_opcoes_filtros(con))
+
+    # 1. Filtro de Data
+    min_date, max_date = opcoes["periodo"]
+    if min_date is None:
+        min_date = datetime.now().date()
+        max_date = datetime.now().date()
+
+    # Ajuste: Usar colunas na sidebar para dar mais espaço ao date_input
+    st.sidebar.markdown("##### 📅 Filtro por Período")
+    col_data1, col_data2 = st.sidebar.columns(2)
+    with col_data1:
+        # A chave inclui o período dos dados para o filtro acompanhar o crescimento do dashboard parcial
+        data_inicio = st.date_input("De", value=min_date, min_value=min_date, max_value=max_date, key=f'data_inicio_{min_date}_{max_date}')
+    with col_data2:
+        data_fim = st.date_input("Até", value=max_date, min_value=min_date, max_value=max_date, key=f'data_fim_{min_date}_{max_date}')
+
+    # 2. Outros Filtros Secundários
+    produto_sel = st.sidebar.multiselect("📦 Produto", opcoes["produtos"], key='produto_sel')
+    solicitante_sel = st.sidebar.multiselect("🧑 Solicitante", opcoes["solicitantes"], key='solicitante_sel')
+    motivo_sel = st.sidebar.multiselect("📝 Motivo Agrupado", opcoes["motivos"], key='motivo_sel')
+
+    # Aplicação dos Filtros Secundários (viram a cláusula WHERE das consultas)
+    filtros = {
+        "data_inicio": data_inicio,
+        "data_fim": data_fim,
+        "produtos": produto_sel,
+        "solicitantes": solicitante_sel,
+        "motivos": motivo_sel,
+    }
+    opcoes_estado = memorizar(cache, ("estados", chave_filtros(filtros)), lambda: calcular_opcoes_estado(con, filtros))
 
-    if arquivo:
-        # -------------------------
-        # Carregar e Tratar Dados com Cache
-        # -------------------------
-        # Força o recarregamento dos dados se o arquivo mudar
-        if 'arquivo_hash' not in st.session_state or st.session_state['arquivo_hash'] != hash(arquivo.read()):
-            # Atualiza o hash e limpa o cache para forçar o load_data a rodar
-            st.session_state['arquivo_hash'] = hash(arquivo.read())
-            load_data.clear()
-            arquivo.seek(0) # Volta o ponteiro do arquivo para o início
-
-        with st.spinner('Processando e limpando os dados. Isso pode levar alguns segundos...'):
-            # Passa o objeto arquivo, não o hash
-            df_tratado = load_data(arquivo) 
-        
-        if df_tratado.empty:
-            return
+    if opcoes_estado["total_solicitacoes"] == 0:
+        st.warning("Nenhum dado encontrado com os filtros de data/secundários selecionados.")
+        return
 
-        # -------------------------
-        # Filtros Interativos (Sidebar) 
-        # -------------------------
-        st.sidebar.header("Filtros de Análise Secundários")
-        
-        # 1. Filtro de Data
-        data_validas = df_tratado["Data"].dropna().dt.date
-        if data_validas.empty:
-            min_date = datetime.now().date()
-            max_date = datetime.now().date()
+    # -------------------------
+    # CARTÃO DE FILTRO DE ESTADO (Área Principal)
+    # -------------------------
+    opcoes_estados = ["Todos"] + opcoes_estado["estados"]
+
+    estado_selecionado = st.selectbox(
+        "📍 **Filtrar por Estado (Card Principal)**",
+        opcoes_estados,
+        index=0,
+        help="Selecione um único estado para refinar as análises no dashboard.",
+        key='estado_selecionado'
+    )
+
+    # Aplicar o filtro de Estado principal
+    filtros["estado"] = estado_selecionado
+    visao = memorizar(cache, ("visao", chave_filtros(filtros)), lambda: calcular_visao(con, filtros))
+    totais = visao["totais"]
+
+    # Checagem final após filtro de estado
+    if totais["total_solicitacoes"] == 0:
+        st.warning(f"Nenhum dado encontrado para o Estado: **{estado_selecionado}**.")
+        return
+
+    st.markdown("---")
+
+    # -------------------------
+    # Métricas Chave (Cards Profissionais)
+    # -------------------------
+    total_solicitacoes = totais["total_solicitacoes"]
+    total_quantidade = totais["total_quantidade"]
+    total_valor_negociado = totais["total_valor_negociado"]
+
+    # Usando um layout de coluna para os cards de métricas
+    col_metrica1, col_metrica2, col_metrica3, col_metrica4 = st.columns(4, gap='large')
+
+    # Métrica 1: Total de Solicitações
+    with col_metrica1:
+        st.metric("Total de Solicitações", formatar_inteiro(total_solicitacoes))
+
+    # Métrica 2: Volume Total de Itens (Usa a função de K/M/B)
+    with col_metrica2:
+        display_total_quantidade_short = formatar_quantidade_metrica(total_quantidade)
+
+        display_total_quantidade_long = formatar_inteiro(total_quantidade)
+
+        st.metric(
+            "Volume Total de Itens",
+            display_total_quantidade_short,
+            help=f"Volume exato: {display_total_quantidade_long}. Valores são formatados com K (Mil), M (Milhão) ou B (Bilhão)."
+        )
+
+    # Métrica 3: Valor Total Negociado (Usa a função de R$ K/M/B)
+    with col_metrica3:
+        display_total_valor_short = formatar_valor_metrica(total_valor_negociado)
+
+        if not pd.isna(total_valor_negociado) and total_valor_negociado is not None:
+            display_total_valor_long = f"R$ {total_valor_negociado:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
         else:
-            min_date = data_validas.min()
-            max_date = data_validas.max()
-
-        # Ajuste: Usar colunas na sidebar para dar mais espaço ao date_input
-        st.sidebar.markdown("##### 📅 Filtro por Período")
-        col_data1, col_data2 = st.sidebar.columns(2)
-        with col_data1:
-            data_inicio = st.date_input("De", value=min_date, min_value=min_date, max_value=max_date, key='data_inicio')
-        with col_data2:
-            data_fim = st.date_input("Até", value=max_date, min_value=min_date, max_value=max_date, key='data_fim')
-
-        # 2. Outros Filtros Secundários
-        produto_sel = st.sidebar.multiselect("📦 Produto", sorted(df_tratado["Produto"].dropna().astype(str).unique()))
-        solicitante_sel = st.sidebar.multiselect("🧑 Solicitante", sorted(df_tratado["Solicitante"].dropna().astype(str).unique()))
-        motivo_sel = st.sidebar.multiselect("📝 Motivo Agrupado", sorted(df_tratado["Motivo_Agrupado"].dropna().astype(str).unique()))
-
-        # Aplicação dos Filtros Secundários
-        df_filtros = df_tratado.copy()
-        
-        # Filtro de Data
-        df_filtros = df_filtros[
-            (df_filtros["Data"].dt.date >= data_inicio) & 
-            (df_filtros["Data"].dt.date <= data_fim)
-        ]
-
-        if produto_sel:
-            df_filtros = df_filtros[df_filtros["Produto"].isin(produto_sel)]
-        if solicitante_sel:
-            df_filtros = df_filtros[df_filtros["Solicitante"].isin(solicitante_sel)]
-        if motivo_sel:
-            df_filtros = df_filtros[df_filtros["Motivo_Agrupado"].isin(motivo_sel)]
-            
-        if df_filtros.empty:
-            st.warning("Nenhum dado encontrado com os filtros de data/secundários selecionados.")
-            return
+            display_total_valor_long = "R$ 0,00"
 
-        # -------------------------
-        # CARTÃO DE FILTRO DE ESTADO (Área Principal) 
-        # -------------------------
-        lista_estados = sorted(df_filtros["Estado"].dropna().astype(str).unique())
-        opcoes_estados = ["Todos"] + lista_estados
-        
-        estado_selecionado = st.selectbox(
-            "📍 **Filtrar por Estado (Card Principal)**", 
-            opcoes_estados, 
-            index=0,
-            help="Selecione um único estado para refinar as análises no dashboard."
+        st.metric(
+            "Valor Total Negociado",
+            display_total_valor_short,
+            help=f"Valor exato negociado: {display_total_valor_long}. Valores são formatados com K (Mil), M (Milhão) ou B (Bilhão)."
         )
 
-        # Aplicar o filtro de Estado principal
-        if estado_selecionado != "Todos":
-            df_filtros = df_filtros[df_filtros["Estado"] == estado_selecionado]
-        
-        # Checagem final após filtro de estado
-        if df_filtros.empty:
-            st.warning(f"Nenhum dado encontrado para o Estado: **{estado_selecionado}**.")
-            return
-            
-        st.markdown("---")
-        
-        # -------------------------
-        # Métricas Chave (Cards Profissionais)
-        # -------------------------
-        total_solicitacoes = df_filtros.shape[0] 
-        total_quantidade = df_filtros["Quantidade"].sum()
-        total_valor_negociado = df_filtros["Valor_Total_Item"].sum() 
-        
-        # Usando um layout de coluna para os cards de métricas
-        col_metrica1, col_metrica2, col_metrica3, col_metrica4 = st.columns(4, gap='large')
-        
-        # Métrica 1: Total de Solicitações
-        with col_metrica1:
-            st.metric("Total de Solicitações", f"{total_solicitacoes:,.0f}".replace(",", "X").replace(".", ",").replace("X", "."))
-        
-        # Métrica 2: Volume Total de Itens (Usa a função de K/M/B)
-        with col_metrica2:
-            display_total_quantidade_short = formatar_quantidade_metrica(total_quantidade)
-            
-            display_total_quantidade_long = f"{total_quantidade:,.0f}".replace(",", "X").replace(".", ",").replace("X", ".")
+    # Métrica 4: Total de Produtos Únicos
+    with col_metrica4:
+        st.metric("Total de Produtos Únicos", totais["produtos_unicos"])
 
-            st.metric(
-                "Volume Total de Itens", 
-                display_total_quantidade_short,
-                help=f"Volume exato: {display_total_quantidade_long}. Valores são formatados com K (Mil), M (Milhão) ou B (Bilhão)."
-            )
-        
-        # Métrica 3: Valor Total Negociado (Usa a função de R$ K/M/B)
-        with col_metrica3:
-            display_total_valor_short = formatar_valor_metrica(total_valor_negociado)
+    # Exportação das linhas de itens com todos os filtros aplicados
+    exibir_exportacao(
+        "Exportar itens filtrados", "itens_filtrados",
+        lambda: consultas.lotes_itens_filtrados(con, filtros, exportacao.TAMANHO_LOTE),
+        lambda: consultas.contar_itens(con, filtros),
+    )
 
-            if not pd.isna(total_valor_negociado) and total_valor_negociado is not None:
-                display_total_valor_long = f"R$ {total_valor_negociado:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
-            else:
-                display_total_valor_long = "R$ 0,00"
-                
-            st.metric(
-                "Valor Total Negociado", 
-                display_total_valor_short, 
-                help=f"Valor exato negociado: {display_total_valor_long}. Valores são formatados com K (Mil), M (Milhão) ou B (Bilhão)."
-            )
-            
-        # Métrica 4: Total de Produtos Únicos
-        with col_metrica4:
-            st.metric("Total de Produtos Únicos", df_filtros["Produto"].nunique())
+    st.markdown("---")
 
-        st.markdown("---")
+    # Análises (gráficos) e explorador dos itens extraídos, em abas
+    aba_analises, aba_itens = st.tabs(["📊 Análises", "🔎 Explorador de Itens"])
 
-        # -------------------------
-        # Configuração de Template do Plotly 
-        # -------------------------
-        PLOTLY_TEMPLATE = "plotly_dark" 
-        
-        # Definição de Cores
-        COLOR_VOLUME = '#1f77b4' # Azul corporativo
-        COLOR_FREQUENCIA = '#ff7f0e' # Laranja para contraste
-        COLOR_SOLICITANTE = '#2ca02c' # Verde
-        COLOR_MOTIVO = '#d62728' # Vermelho/Tijolo
-        
+    with aba_analises:
         # -------------------------
         # SEÇÃO 1: Análise Comparativa de Produtos
         # -------------------------
         st.subheader("Análise 1: Comparativo de Produtos (Volume de Itens vs. Frequência de Solicitação)")
-        
+
         col_g1, col_g2 = st.columns(2, gap='medium')
-        
+
         # --- COLUNA 1: GRÁFICO 1 (VOLUME) ---
         with col_g1:
             st.markdown("##### 📦 Volume Total de Itens por Produto (Top 10)")
-            
-            # Cálculo de Volume: SOMA da coluna Quantidade
-            top_produtos_volume = df_filtros.groupby("Produto")["Quantidade"].sum().sort_values(ascending=False).head(10).reset_index()
-            top_produtos_volume.columns = ["Produto", "Quantidade Total"]
-            
-            fig_top_produtos_volume = px.bar(
-                top_produtos_volume,
-                x="Produto",
-                y="Quantidade Total",
-                title="Top 10 Produtos por Volume de Itens",
-                template=PLOTLY_TEMPLATE, 
-            )
-            
-            # Formatação: Usa a função formatar_quantidade_metrica para exibir o valor em K/M/B
-            fig_top_produtos_volume.update_traces(
-                text=top_produtos_volume["Quantidade Total"].apply(formatar_quantidade_metrica), 
-                texttemplate='%{text}', 
-                textposition='outside', 
-                marker_color=COLOR_VOLUME
-            ) 
-            fig_top_produtos_volume.update_yaxes(tickformat=".2s", title_text="Quantidade Total (Mil/Milhão)") 
-            fig_top_produtos_volume.update_xaxes(title_text="Produto (Códigos)")
-            st.plotly_chart(fig_top_produtos_volume, use_container_width=True)
+            exibir_grafico(visao, "top_produtos_volume")
 
         # --- COLUNA 2: GRÁFICO 2 (CONTAGEM DE SOLICITAÇÕES POR PRODUTO) ---
         with col_g2:
             st.markdown("##### 📈 Frequência de Solicitações por Produto (Top 10)")
-            
-            # Cálculo de Frequência: CONTAGEM de linhas (solicitações)
-            top_produtos_contagem = df_filtros.groupby("Produto").size().reset_index(name='Contagem de Solicitações').sort_values("Contagem de Solicitações", ascending=False).head(10)
-            
-            fig_top_produtos_contagem = px.bar(
-                top_produtos_contagem,
-                x="Produto",
-                y="Contagem de Solicitações",
-                title="Top 10 Produtos por Frequência de Solicitação",
-                template=PLOTLY_TEMPLATE, 
-            )
-            
-            # Formatação: Exibe o número inteiro da contagem (Ex: 5)
-            fig_top_produtos_contagem.update_traces(
-                # Garante que o número seja exibido sem separador decimal (apenas separador de milhar se > 1000)
-                text=top_produtos_contagem["Contagem de Solicitações"].apply(lambda x: f"{x:,.0f}".replace(",", "X").replace(".", ",").replace("X", ".")),
-                texttemplate='%{text}', 
-                textposition='outside', 
-                marker_color=COLOR_FREQUENCIA
-            ) 
-            fig_top_produtos_contagem.update_yaxes(tickformat=',.', title_text="Número de Solicitações") 
-            fig_top_produtos_contagem.update_xaxes(title_text="Produto (Códigos)")
-            st.plotly_chart(fig_top_produtos_contagem, use_container_width=True)
+            exibir_grafico(visao, "top_produtos_frequencia")
 
 
         st.markdown("---")
-        
+
         # -------------------------
-        # SEÇÃO 2: Solicitantes e Motivos 
+        # SEÇÃO 2: Solicitantes e Motivos
         # -------------------------
         st.subheader("Análise 2: Solicitantes e Motivos de Negociação")
-        
+
         col_g3, col_g4 = st.columns(2, gap='medium')
 
         # --- COLUNA 1: GRÁFICO 3 (SOLICITANTES) ---
         with col_g3:
             st.markdown("##### 🧑 Solicitantes com Maior Frequência de Solicitações (Top 15)")
-            
-            # Ordena ascendentemente para que o gráfico de barras horizontais fique do maior para o menor
-            solicitantes_contagem = df_filtros.groupby("Solicitante").size().reset_index(name='Contagem').sort_values("Contagem", ascending=True).tail(15)
-            
-            fig_solicitantes = px.bar(
-                solicitantes_contagem, 
-                x="Contagem",
-                y="Solicitante", 
-                orientation='h', 
-                title="Top 15 Solicitantes",
-                template=PLOTLY_TEMPLATE, 
-            )
-            
-            # Formatação 
-            fig_solicitantes.update_traces(
-                text=solicitantes_contagem["Contagem"].apply(formatar_quantidade_metrica), 
-                texttemplate='%{text}', 
-                textposition='outside', 
-                marker_color=COLOR_SOLICITANTE
-            )
-            # Mantém tickformat compacto para o Plotly cuidar do eixo
-            fig_solicitantes.update_xaxes(tickformat=".2s", title_text="Número de Solicitações (Mil/Milhão)")
-            fig_solicitantes.update_layout(yaxis={'categoryorder':'total ascending'})
-            st.plotly_chart(fig_solicitantes, use_container_width=True)
+            exibir_grafico(visao, "top_solicitantes")
 
         # --- COLUNA 2: GRÁFICO 4 (MOTIVOS AGRUPADOS) ---
         with col_g4:
             st.markdown("##### 📝 Frequência de Solicitações por Motivo Agrupado (Top 10)")
-            
-            motivos_contagem = df_filtros.groupby("Motivo_Agrupado").size().reset_index(name='Contagem').sort_values("Contagem", ascending=False)
-            
-            fig_motivos = px.bar(
-                motivos_contagem.head(10), 
-                x="Motivo_Agrupado",
-                y="Contagem",
-                title="Top 10 Motivos",
-                template=PLOTLY_TEMPLATE, 
+            # A exportação leva todos os motivos, não só os 10 do gráfico
+            exibir_grafico(visao, "motivos")
+
+    with aba_itens:
+        exibir_explorador_itens(con, cache, filtros)
+
+    st.markdown("---")
+
+    # -------------------------
+    # SEÇÃO 3: Consulta SQL (Usuários Avançados)
+    # -------------------------
+    exibir_consulta_sql(df_tratado, filtros)
+
+
+# Opções de itens por página do explorador (só a página visível vai para o navegador)
+TAMANHOS_PAGINA_ITENS = [25, 50, 100, 200]
+
+def exibir_explorador_itens(con, cache, filtros):
+    """
+    Tabela paginada dos itens extraídos com os filtros atuais. Busca, ordenação e
+    paginação são consultas SQL: só a página visível é enviada ao navegador, por
+    maior que seja a planilha. Selecionar um item mostra o texto original da
+    resposta e todos os itens extraídos dela.
+    """
+    col_busca, col_ordem, col_direcao, col_tamanho = st.columns([3, 2, 1, 1], vertical_alignment="bottom")
+    with col_busca:
+        busca = st.text_input(
+            "🔎 Buscar", key="busca_itens", placeholder="Produto, estado, solicitante ou motivo"
+        ).strip()
+    with col_ordem:
+        ordenar_por = st.selectbox("Ordenar por", consultas.COLUNAS_EXPLORADOR, key="ordem_itens")
+    with col_direcao:
+        decrescente = st.toggle("Decrescente", key="decrescente_itens")
+    with col_tamanho:
+        tamanho_pagina = st.selectbox("Itens por página", TAMANHOS_PAGINA_ITENS, index=1, key="tamanho_pagina_itens")
+
+    chave_busca = chave_filtros({**filtros, "busca": busca})
+    total = memorizar(cache, ("itens_total", chave_busca), lambda: consultas.contar_itens(con, filtros, busca))
+    if total == 0:
+        st.info("Nenhum item encontrado com a busca e os filtros atuais.")
+        return
+
+    # A página (e a seleção) voltam ao início quando a busca, os filtros ou a ordenação mudam
+    estado_tabela = f"{chave_busca}_{ordenar_por}_{decrescente}_{tamanho_pagina}"
+    total_paginas = -(-total // tamanho_pagina)
+    col_pagina, col_contagem = st.columns([1, 5], vertical_alignment="bottom")
+    with col_pagina:
+        pagina = st.number_input(
+            f"Página (de {formatar_inteiro(total_paginas)})", min_value=1, max_value=total_paginas,
+            value=1, step=1, key=f"pagina_itens_{estado_tabela}",
+        )
+    inicio = (pagina - 1) * tamanho_pagina
+    with col_contagem:
+        st.caption(
+            f"Itens {formatar_inteiro(inicio + 1)} a {formatar_inteiro(min(inicio + tamanho_pagina, total))} "
+            f"de {formatar_inteiro(total)}. Selecione um item para ver a resposta original."
+        )
+
+    df_pagina = memorizar(
+        cache, ("itens_pagina", estado_tabela, pagina),
+        lambda: consultas.pagina_itens(con, filtros, busca, ordenar_por, decrescente, tamanho_pagina, inicio),
+    )
+    evento = st.dataframe(
+        df_pagina,
+        hide_index=True,
+        use_container_width=True,
+        on_select="rerun",
+        selection_mode="single-row",
+        key=f"tabela_itens_{estado_tabela}_{pagina}",
+    )
+
+    if evento.selection.rows:
+        exibir_resposta_original(con, df_pagina["Linha_Planilha"].iloc[evento.selection.rows[0]])
+
+
+def exibir_resposta_original(con, linha):
+    """Texto original da resposta da linha `linha` da planilha e os itens extraídos dela."""
+    st.markdown(f"##### 📄 Resposta da linha {linha} da planilha")
+    texto = consultas.texto_resposta(con, linha)
+    if texto is None:
+        st.info("O texto original desta resposta não está disponível.")
+    else:
+        st.code(texto, language=None, wrap_lines=True)
+
+    st.markdown("###### Itens extraídos desta resposta (sem filtros)")
+    st.dataframe(consultas.itens_da_resposta(con, linha), hide_index=True, use_container_width=True)
+
+
+def exibir_exportacao(rotulo, nome, obter_lotes, contar_linhas=None):
+    """
+    Botão de exportação: o arquivo só é gerado quando o usuário pede, a partir dos
+    lotes devolvidos por `obter_lotes()` (RecordBatchReader), e vira um download.
+    `contar_linhas()` dá o total de linhas antes da geração, para recusar logo uma
+    exportação acima do limite do formato.
+    """
+    with st.popover(f"⬇️ {rotulo}"):
+        formato = st.radio("Formato", list(exportacao.FORMATOS), horizontal=True, key=f"formato_{nome}")
+        if st.button("Gerar arquivo", key=f"gerar_{nome}"):
+            extensao, mimetype = exportacao.FORMATOS[formato]
+            try:
+                total_linhas = contar_linhas() if contar_linhas is not None else None
+                if total_linhas is not None:
+                    exportacao.verificar_limite(formato, total_linhas)
+                with st.spinner("Gerando o arquivo..."):
+                    dados = exportacao.gerar_arquivo(obter_lotes(), formato)
+            except ValueError as e:
+                st.error(str(e))
+                return
+            except Exception as e:
+                st.error(f"Erro ao gerar o arquivo: {e}")
+                return
+
+            st.download_button(
+                "Baixar arquivo",
+                data=dados,
+                file_name=f"{nome}{extensao}",
+                mime=mimetype,
+                key=f"baixar_{nome}",
+                on_click="ignore", # Baixar não precisa reexecutar o dashboard
             )
-            
-            # Formatação 
-            fig_motivos.update_traces(
-                # Garante que o número seja exibido sem separador decimal (apenas separador de milhar se > 1000)
-                text=motivos_contagem["Contagem"].head(10).apply(lambda x: f"{x:,.0f}".replace(",", "X").replace(".", ",").replace("X", ".")),
-                texttemplate='%{text}', 
-                textposition='outside', 
-                marker_color=COLOR_MOTIVO
+
+
+def exibir_consulta_sql(df_tratado, filtros):
+    """Caixa de SQL livre sobre as tabelas `itens` (todos os itens) e `itens_filtrados` (filtros atuais)."""
+    with st.expander("🧮 Consulta SQL (Avançado)"):
+        st.caption(
+            "Tabelas disponíveis: `itens` (todos os itens tratados) e `itens_filtrados` (itens com os filtros atuais). "
+            f"São exibidas no máximo {consultas.LIMITE_LINHAS_SQL:,} linhas e a consulta é interrompida após "
+            f"{consultas.TEMPO_LIMITE_SQL} segundos.".replace(",", ".")
+        )
+        with st.form("form_consulta_sql"):
+            sql = st.text_area(
+                "Consulta",
+                value=(
+                    'SELECT "Solicitante", "AnoMes", SUM("Quantidade") AS volume\n'
+                    'FROM itens_filtrados\n'
+                    'GROUP BY ALL\n'
+                    'ORDER BY "AnoMes", volume DESC'
+                ),
+                height=150,
             )
-            fig_motivos.update_yaxes(tickformat=',.') 
-            fig_motivos.update_xaxes(title_text="Motivo Agrupado", categoryorder='total descending')
-            fig_motivos.update_layout(yaxis_title="Número de Solicitações")
-            st.plotly_chart(fig_motivos, use_container_width=True)
-            
-        st.markdown("---")
+            executar = st.form_submit_button("Executar")
+
+        if executar:
+            try:
+                st.session_state['resultado_sql'] = consultas.executar_sql_usuario(sql, df_tratado, filtros)
+                st.session_state['erro_sql'] = None
+            except Exception as e:
+                st.session_state['resultado_sql'] = None
+                st.session_state['erro_sql'] = str(e)
+
+        if st.session_state.get('erro_sql'):
+            st.error(f"Erro na consulta: {st.session_state['erro_sql']}")
+        elif st.session_state.get('resultado_sql') is not None:
+            st.dataframe(st.session_state['resultado_sql'], use_container_width=True)
+
+
+# -------------------------
+# App principal
+# -------------------------
+def main():
+    st.title("📦📈 Dashboard Estratégico de Solicitações de Produtos")
+    
+    # -------------------------
+    # LAYOUT DE FILTRO PRINCIPAL (Estado)
+    # -------------------------
+    st.markdown("---") # Linha divisória
+    
+    # Carregador de Arquivo
+    arquivo = st.file_uploader("Carregue a planilha Excel", type=["xlsx"], help="A planilha deve conter os dados de resposta do formulário.")
+    
+    st.markdown("---") # Linha divisória
+
+    if arquivo:
+        # -------------------------
+        # Carregar e Tratar Dados (Segundo Plano)
+        # -------------------------
+        # Reinicia o processamento em segundo plano se o arquivo mudar.
+        # O conteúdo é lido uma única vez (memoryview, sem cópia) e identificado pelo SHA-256,
+        # calculado só quando chega um novo upload (file_id), e não a cada reexecução
+        if st.session_state.get('arquivo_id') != arquivo.file_id:
+            st.session_state['arquivo_id'] = arquivo.file_id
+            st.session_state['digest_upload'] = upload.calcular_digest(upload.visao_upload(arquivo))
+        arquivo_digest = st.session_state['digest_upload']
+        processamento_anterior = st.session_state.get('processamento')
+        if (
+            st.session_state.get('arquivo_digest') != arquivo_digest
+            or processamento_anterior is None
+            or processamento_anterior.cancelado
+        ):
+            if processamento_anterior is not None:
+                processamento_anterior.cancelar() # O arquivo anterior não precisa mais ser processado
+            st.session_state['arquivo_digest'] = arquivo_digest
+            st.session_state['processamento'] = ProcessamentoPlanilha(upload.LeitorBuffer(upload.visao_upload(arquivo)), arquivo_digest).iniciar()
+
+        processamento = st.session_state['processamento']
+        concluido = processamento.concluido # Lido uma única vez para a execução inteira ser consistente
+
+        if processamento.erro is not None:
+            getattr(st, processamento.erro.nivel)(processamento.erro.mensagem)
+            return
+
+        if not concluido:
+            if processamento.linhas_processadas == 0:
+                texto_progresso = "Lendo a planilha..."
+            else:
+                total = processamento.total_linhas if processamento.total_linhas is not None else "?"
+                texto_progresso = (
+                    f"Processando e limpando os dados: {processamento.linhas_processadas} de "
+                    f"{total} linhas. Os números abaixo são parciais."
+                )
+            st.progress(processamento.progresso(), text=texto_progresso)
+
+        df_tratado = processamento.resultado()
+
+        if df_tratado.empty:
+            if concluido:
+                st.warning("Nenhum produto foi encontrado nas respostas da planilha.")
+            else:
+                aguardar_processamento()
+            return
+
+        if concluido:
+            exibir_relatorio_truncamento(df_tratado)
+            exibir_relatorio_motivos(df_tratado)
+            exibir_dashboard(df_tratado, processamento.caminho_parquet, processamento.chave, processamento.respostas())
+        else:
+            exibir_dashboard(df_tratado, respostas=processamento.respostas())
+            aguardar_processamento()
 
 
 if __name__ == '__main__':
-    # Adiciona o estado de sessão para controle de cache
-    if 'arquivo_hash' not in st.session_state:
-        st.session_state['arquivo_hash'] = None
-        
     main()
@@ -0,0 +1,114 @@
+"""
+Benchmark de estresse e fuzz da extração de produtos (extrair_produtos / tratar_linha).
+
+Roda textos adversariais (sequências enormes de dígitos, separadores 'X'/'-'
+repetidos, listas enormes de 'R$', e-mails colados) e textos aleatórios montados
+com os mesmos ingredientes, medindo o pior tempo por resposta. Termina com erro
+se algum texto passar do limite, provando que o tempo por linha é limitado.
+
+Uso:
+    python benchmark_extracao.py [--fuzz 500] [--semente 42] [--limite-ms 250]
+"""
+import argparse
+import random
+import sys
+import time
+
+import app1 # Fora do `streamlit run`, o Streamlit avisa que está em "bare mode"; pode ignorar
+
+# -------------------------
+# Textos adversariais fixos
+# -------------------------
+CASOS_ESTRESSE = {
+    "dígitos (5 mil)": "1" * 5_000,
+    "dígitos (200 mil)": "7" * 200_000,
+    "dígitos com espaço a cada 21": ("1" * 21 + " ") * 10_000,
+    "código X quantidade repetido": "12345 X 4 " * 20_000,
+    "separador X sem espaços": "1X" * 100_000,
+    "separador - sem espaços": "1-" * 100_000,
+    "X e - alternados": "12345-1X" * 30_000,
+    "lista enorme de R$": "R$ 1.234,56 " * 30_000,
+    "R$ com pontuação sem fim": "R$ " + "1.," * 100_000,
+    "quantidade + UN repetidos": "4 UNIDADES 23131 " * 20_000,
+    "códigos distintos": " ".join(str(10_000 + i) for i in range(50_000)),
+    "e-mail colado": (
+        "De: fulano@empresa.com.br\nEnviado em: 01/02/2025\nSolicitante: Fulano\n"
+        "Segue pedido 23131 X 4 R$ 10,00 e 45678 - 2 R$ 5,50. Att.\n"
+    ) * 5_000,
+    "solicitante: repetido": "solicitante " * 50_000,
+}
+
+# Ingredientes do fuzz (combinados aleatoriamente)
+INGREDIENTES = [
+    lambda r: "9" * r.randint(1, 50_000),
+    lambda r: str(r.randint(10_000, 99_999)),
+    lambda r: " X " * r.randint(1, 50),
+    lambda r: "X" * r.randint(1, 2_000),
+    lambda r: "-" * r.randint(1, 2_000),
+    lambda r: "R$ " + "".join(r.choice("0123456789.,") for _ in range(r.randint(1, 5_000))),
+    lambda r: " UN " * r.randint(1, 100),
+    lambda r: " " * r.randint(1, 1_000),
+    lambda r: "\n" * r.randint(1, 100),
+    lambda r: "Estado: PR Motivo: desconto ",
+    lambda r: "".join(r.choice("abcdefghij ") for _ in range(r.randint(1, 5_000))),
+]
+
+
+def gerar_texto_fuzz(aleatorio):
+    """Texto aleatório com até ~60 ingredientes adversariais."""
+    return "".join(aleatorio.choice(INGREDIENTES)(aleatorio) for _ in range(aleatorio.randint(1, 60)))
+
+
+def medir(texto):
+    """Tempo (s) de tratar uma resposta com o texto na coluna de produtos, e as ocorrências registradas."""
+    colunas = {
+        "data": None, "produto_preco": "texto", "analise": None,
+        "estado": None, "solicitante": None, "motivo": None,
+    }
+    ocorrencias = []
+    inicio = time.perf_counter()
+    app1.tratar_linha({"texto": texto}, colunas, ocorrencias)
+    return time.perf_counter() - inicio, ocorrencias
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fuzz", type=int, default=500, help="Quantidade de textos aleatórios")
+    parser.add_argument("--semente", type=int, default=42, help="Semente do gerador aleatório")
+    parser.add_argument("--limite-ms", type=float, default=250.0, help="Tempo máximo aceito por resposta (ms)")
+    args = parser.parse_args()
+
+    resultados = []
+    for nome, texto in CASOS_ESTRESSE.items():
+        segundos, ocorrencias = medir(texto)
+        resultados.append((nome, len(texto), segundos, ocorrencias))
+
+    aleatorio = random.Random(args.semente)
+    for i in range(args.fuzz):
+        texto = gerar_texto_fuzz(aleatorio)
+        segundos, ocorrencias = medir(texto)
+        resultados.append((f"fuzz #{i}", len(texto), segundos, ocorrencias))
+
+    print(f"{'Caso':<32} {'Tamanho':>10} {'Tempo (ms)':>11}  Ocorrências")
+    for nome, tamanho, segundos, ocorrencias in resultados[:len(CASOS_ESTRESSE)]:
+        print(f"{nome:<32} {tamanho:>10} {segundos * 1000:>11.2f}  {'; '.join(ocorrencias)}")
+
+    tempos_fuzz = sorted(segundos for _, _, segundos, _ in resultados[len(CASOS_ESTRESSE):])
+    if tempos_fuzz:
+        print(
+            f"\nFuzz: {len(tempos_fuzz)} textos, mediana {tempos_fuzz[len(tempos_fuzz) // 2] * 1000:.2f} ms, "
+            f"máximo {tempos_fuzz[-1] * 1000:.2f} ms"
+        )
+
+    pior = max(resultados, key=lambda resultado: resultado[2])
+    print(f"Pior caso: {pior[0]} ({pior[1]} caracteres) em {pior[2] * 1000:.2f} ms")
+
+    if pior[2] * 1000 > args.limite_ms:
+        print(f"FALHA: tempo por resposta acima de {args.limite_ms:.0f} ms")
+        return 1
+    print(f"OK: todas as respostas abaixo de {args.limite_ms:.0f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
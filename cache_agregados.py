@@ -0,0 +1,91 @@
+import json
+import sys
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+
+import pandas as pd
+
+# ----------------------------------------------------
+# Cache LRU de Agregações por Estado dos Filtros
+# ----------------------------------------------------
+# Guarda, para um dataset (digest do upload), as tabelas agregadas e as figuras
+# já serializadas de cada combinação de filtros visitada. Voltar a uma combinação
+# já vista redesenha o dashboard sem consultas nem construção de gráficos.
+# O cache é limitado pelo tamanho estimado em bytes: ao passar do limite, as
+# combinações usadas há mais tempo são descartadas.
+
+
+def chave_filtros(filtros):
+    """
+    Forma canônica do estado dos filtros: listas ordenadas, datas em ISO e chaves
+    em ordem, para que a mesma seleção feita em outra ordem gere a mesma chave.
+    """
+    def normalizar(valor):
+        if isinstance(valor, (list, tuple, set)):
+            return sorted(str(item) for item in valor)
+        if isinstance(valor, (date, datetime)):
+            return valor.isoformat()
+        return valor
+
+    return json.dumps({chave: normalizar(valor) for chave, valor in filtros.items()}, sort_keys=True, default=str)
+
+
+def tamanho_em_bytes(valor):
+    """Estimativa do espaço ocupado por um valor do cache (DataFrames, textos e coleções deles)."""
+    if isinstance(valor, pd.DataFrame):
+        return int(valor.memory_usage(index=True, deep=True).sum())
+    if isinstance(valor, (str, bytes)):
+        return sys.getsizeof(valor)
+    if isinstance(valor, dict):
+        return sys.getsizeof(valor) + sum(tamanho_em_bytes(k) + tamanho_em_bytes(v) for k, v in valor.items())
+    if isinstance(valor, (list, tuple)):
+        return sys.getsizeof(valor) + sum(tamanho_em_bytes(item) for item in valor)
+    return sys.getsizeof(valor)
+
+
+class CacheAgregados:
+    """LRU limitado em bytes, seguro para uso por várias sessões (threads) ao mesmo tempo."""
+
+    def __init__(self, limite_bytes):
+        self.limite_bytes = limite_bytes
+        self.bytes_usados = 0
+        self._entradas = OrderedDict() # chave -> (valor, tamanho)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entradas)
+
+    def obter(self, chave):
+        """Valor guardado para a chave (marcando-o como usado agora), ou None."""
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is None:
+                return None
+            self._entradas.move_to_end(chave)
+            return entrada[0]
+
+    def guardar(self, chave, valor):
+        """Guarda o valor e descarta os menos usados até caber no limite."""
+        tamanho = tamanho_em_bytes(valor)
+        if tamanho > self.limite_bytes:
+            return # Maior que o cache inteiro: não vale a pena guardar
+
+        with self._lock:
+            antigo = self._entradas.pop(chave, None)
+            if antigo is not None:
+                self.bytes_usados -= antigo[1]
+            self._entradas[chave] = (valor, tamanho)
+            self.bytes_usados += tamanho
+
+            while self.bytes_usados > self.limite_bytes:
+                _, (_, tamanho_descartado) = self._entradas.popitem(last=False)
+                self.bytes_usados -= tamanho_descartado
+
+    def obter_ou_calcular(self, chave, calcular):
+        """Devolve o valor em cache ou o calcula com `calcular()` e guarda."""
+        valor = self.obter(chave)
+        if valor is None:
+            valor = calcular()
+            self.guardar(chave, valor)
+        return valor
@@ -0,0 +1,102 @@
+import hashlib
+import json
+import re
+import unicodedata
+
+# ----------------------------------------------------
+# Classificação dos Motivos de Negociação por Regras
+# ----------------------------------------------------
+# As categorias e suas palavras-chave ficam num arquivo JSON (regras_motivos.json):
+# para criar ou ajustar uma categoria basta editar o arquivo.
+# Todas as palavras-chave são compiladas numa única expressão regular em forma
+# de árvore de prefixos (trie), então cada motivo é percorrido uma vez só,
+# qualquer que seja o número de regras. Motivos repetidos são classificados
+# uma única vez: os motores de dados (motores.py) aplicam o padronizar_motivo
+# do app1, que usa o classificar_texto, uma vez por valor distinto da coluna.
+
+
+def normalizar(texto):
+    """Minúsculas e sem acentos ('Promoção' -> 'promocao'), para comparar textos e palavras-chave."""
+    return ''.join(c for c in unicodedata.normalize('NFD', texto) if unicodedata.category(c) != 'Mn').lower()
+
+
+def _regex_trie(palavras):
+    """
+    Expressão regular que reconhece qualquer uma das palavras, montada como uma
+    árvore de prefixos (ex.: 'manter', 'manter os valores' -> 'manter(?: os valores)?').
+    Numa mesma posição do texto, casa sempre a palavra mais longa.
+    """
+    trie = {}
+    for palavra in palavras:
+        no = trie
+        for caractere in palavra:
+            no = no.setdefault(caractere, {})
+        no[""] = {} # Marca o fim de uma palavra
+
+    def montar(no):
+        ramos = [re.escape(caractere) + montar(filho) for caractere, filho in sorted(no.items()) if caractere]
+        if not ramos:
+            return ""
+        grupo = ramos[0] if len(ramos) == 1 else "(?:" + "|".join(ramos) + ")"
+        return f"(?:{grupo})?" if "" in no else grupo
+
+    return montar(trie)
+
+
+class ClassificadorMotivos:
+    """
+    Atribui a cada motivo a categoria de maior prioridade (ordem no arquivo) entre
+    as palavras-chave encontradas nele, ou None se nenhuma for encontrada.
+    """
+
+    def __init__(self, categorias):
+        """`categorias`: lista de {"nome": ..., "palavras_chave": [...]}, da maior para a menor prioridade."""
+        self.categorias = [categoria["nome"] for categoria in categorias]
+
+        # Palavra-chave normalizada -> prioridade (índice da categoria); na repetição vale a primeira
+        self._prioridades = {}
+        for prioridade, categoria in enumerate(categorias):
+            for palavra in categoria["palavras_chave"]:
+                self._prioridades.setdefault(normalizar(palavra.strip()), prioridade)
+        self._prioridades.pop("", None)
+
+        # O regex devolve a palavra mais longa que começa em cada posição. Se uma palavra
+        # começa com outra de prioridade igual ou maior, a mais curta sempre decide:
+        # a mais longa é descartada para não esconder a mais curta.
+        palavras = [
+            palavra for palavra, prioridade in self._prioridades.items()
+            if not any(
+                self._prioridades.get(palavra[:tamanho], prioridade + 1) <= prioridade
+                for tamanho in range(1, len(palavra))
+            )
+        ]
+        # Lookahead: encontra palavras sobrepostas (uma em cada posição do texto)
+        self._regex = re.compile(f"(?=({_regex_trie(palavras)}))") if palavras else None
+
+        regras = json.dumps(categorias, sort_keys=True, ensure_ascii=False)
+        self.versao = hashlib.sha256(regras.encode("utf-8")).hexdigest()[:12]
+
+    @classmethod
+    def de_arquivo(cls, caminho):
+        """Carrega as regras do arquivo JSON ({"categorias": [...]})."""
+        with open(caminho, encoding="utf-8") as arquivo:
+            regras = json.load(arquivo)
+
+        categorias = regras.get("categorias") if isinstance(regras, dict) else None
+        if not isinstance(categorias, list) or not all(
+            isinstance(categoria, dict) and isinstance(categoria.get("nome"), str)
+            and isinstance(categoria.get("palavras_chave"), list)
+            for categoria in categorias
+        ):
+            raise ValueError(
+                f"Arquivo de regras inválido ({caminho}): esperado "
+                '{"categorias": [{"nome": "...", "palavras_chave": ["..."]}, ...]}'
+            )
+        return cls(categorias)
+
+    def classificar_texto(self, texto):
+        """Categoria de um único motivo, ou None."""
+        if self._regex is None or not isinstance(texto, str):
+            return None
+        prioridades = [self._prioridades[palavra] for palavra in self._regex.findall(normalizar(texto))]
+        return self.categorias[min(prioridades)] if prioridades else None
@@ -0,0 +1,432 @@
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+import duckdb
+import pandas as pd
+
+# ----------------------------------------------------
+# Motor de Consultas SQL (DuckDB) sobre os dados tratados
+# ----------------------------------------------------
+# As agregações do dashboard são consultas SQL executadas pelo DuckDB, que roda
+# em processo, de forma vetorizada e usando todos os núcleos da máquina.
+# Quando o processamento termina, o DataFrame tratado é gravado em Parquet e as
+# consultas passam a ler o arquivo (com filtros empurrados para a leitura).
+# O cache é indexado pelo digest SHA-256 do upload, então sobrevive a reinícios
+# do servidor e é compartilhado entre sessões que carregam a mesma planilha.
+# A pasta é privada do usuário do servidor e os arquivos menos usados são
+# descartados pelo limite de tamanho e de idade.
+
+
+def preparar_pasta_cache(pasta):
+    """
+    Cria a pasta do cache só com permissão para o usuário atual. Uma pasta que
+    já exista e pertença a outro usuário é recusada: os nomes dos arquivos são
+    previsíveis (digest da planilha) e poderiam ser criados antes por outra pessoa.
+    """
+    os.makedirs(pasta, mode=0o700, exist_ok=True)
+    if hasattr(os, "getuid"): # Permissões POSIX (no Windows a pasta do usuário já é privada)
+        info = os.stat(pasta)
+        if info.st_uid != os.getuid():
+            raise RuntimeError(
+                f"A pasta de cache {pasta} pertence a outro usuário. "
+                "Defina outra pasta na variável de ambiente ANALISTA_PASTA_CACHE."
+            )
+        if info.st_mode & 0o077:
+            os.chmod(pasta, 0o700)
+    return pasta
+
+
+# Pasta do cache Parquet (variável de ambiente ANALISTA_PASTA_CACHE ou ~/.cache/analista_produto)
+PASTA_CACHE = preparar_pasta_cache(
+    os.environ.get("ANALISTA_PASTA_CACHE")
+    or os.path.join(os.path.expanduser("~"), ".cache", "analista_produto")
+)
+
+# Limites do cache: acima do tamanho, as planilhas usadas há mais tempo são
+# descartadas; planilhas não usadas há mais que a idade máxima também
+LIMITE_CACHE_BYTES = 2 * 1024 ** 3
+IDADE_MAXIMA_CACHE = 30 * 24 * 3600 # Segundos
+
+# Linhas por row group no Parquet: grupos menores permitem descartar mais dados
+# pelas estatísticas (min/max) dos filtros de data
+TAMANHO_GRUPO_LINHAS = 100_000
+
+# Limite de linhas exibidas no resultado da caixa de SQL
+LIMITE_LINHAS_SQL = 1_000
+
+# Recursos da caixa de SQL: a consulta roda no processo do servidor, então um
+# CROSS JOIN acidental não pode tomar todos os núcleos e a memória das outras sessões
+THREADS_SQL = 2
+MEMORIA_SQL = "512MB"
+TEMPO_LIMITE_SQL = 30 # Segundos até a consulta ser interrompida
+
+# Colunas do explorador de itens, na ordem exibida (também as opções de ordenação)
+COLUNAS_EXPLORADOR = [
+    "Linha_Planilha", "Data", "Produto", "Quantidade", "Preco_Solicitado", "Valor_Total_Item",
+    "Estado", "Solicitante", "Motivo_Agrupado", "Motivo",
+]
+
+# Colunas de texto em que a busca do explorador procura
+COLUNAS_BUSCA = ["Produto", "Estado", "Solicitante", "Motivo", "Motivo_Agrupado"]
+
+
+def caminho_em_cache(chave):
+    """Caminho do Parquet já gravado para a chave, ou None se ainda não existir."""
+    caminho = os.path.join(PASTA_CACHE, f"{chave}.parquet")
+    if not os.path.exists(caminho):
+        return None
+    _marcar_uso(caminho)
+    return caminho
+
+
+def _marcar_uso(caminho):
+    """Atualiza a data de modificação do arquivo: é ela que ordena o descarte do cache."""
+    try:
+        os.utime(caminho)
+    except OSError:
+        pass # Descartado por outra sessão nesse meio-tempo
+
+
+def _planilha_do_arquivo(nome):
+    """Chave da planilha a que um arquivo do cache pertence (itens e textos das respostas juntos)."""
+    chave = nome.split(".parquet")[0]
+    return chave[:-len("_respostas")] if chave.endswith("_respostas") else chave
+
+
+def limpar_cache(manter=()):
+    """
+    Descarta do cache as planilhas não usadas há mais de IDADE_MAXIMA_CACHE e, se
+    ainda passar de LIMITE_CACHE_BYTES, as usadas há mais tempo. Os arquivos de
+    uma planilha saem juntos; as chaves em `manter` nunca são descartadas.
+    Temporários (.tmp) só saem depois da idade máxima: podem estar sendo gravados.
+    """
+    agora = time.time()
+    planilhas = {} # chave -> [uso mais recente, bytes, arquivos]
+    for entrada in os.scandir(PASTA_CACHE):
+        try:
+            info = entrada.stat()
+        except OSError:
+            continue
+        if entrada.name.endswith(".tmp"):
+            if agora - info.st_mtime > IDADE_MAXIMA_CACHE:
+                _remover(entrada.path)
+            continue
+        planilha = planilhas.setdefault(_planilha_do_arquivo(entrada.name), [0.0, 0, []])
+        planilha[0] = max(planilha[0], info.st_mtime)
+        planilha[1] += info.st_size
+        planilha[2].append(entrada.path)
+
+    total = sum(tamanho for _, tamanho, _ in planilhas.values())
+    for chave, (uso, tamanho, arquivos) in sorted(planilhas.items(), key=lambda item: item[1][0]):
+        if chave in manter:
+            continue
+        if agora - uso <= IDADE_MAXIMA_CACHE and total <= LIMITE_CACHE_BYTES:
+            break
+        for arquivo in arquivos:
+            _remover(arquivo)
+        total -= tamanho
+
+
+def _remover(caminho):
+    try:
+        os.remove(caminho)
+    except OSError:
+        pass # Já removido por outra sessão
+
+
+def salvar_parquet(df, chave, ordenar_por="Data"):
+    """Grava o DataFrame (itens tratados ou textos das respostas) no cache Parquet e retorna o caminho do arquivo."""
+    caminho = os.path.join(PASTA_CACHE, f"{chave}.parquet")
+    # Nome temporário único: duas sessões podem gravar a mesma planilha ao mesmo tempo
+    caminho_temporario = f"{caminho}.{uuid.uuid4().hex}.tmp"
+    # Ordena por data para os row groups terem faixas de data bem separadas
+    df.sort_values(ordenar_por, kind="stable").to_parquet(
+        caminho_temporario, index=False, row_group_size=TAMANHO_GRUPO_LINHAS
+    )
+    os.replace(caminho_temporario, caminho) # Só aparece completo para os leitores
+    return caminho
+
+
+def conectar(df_tratado=None, caminho_parquet=None, respostas=None):
+    """
+    Abre uma conexão DuckDB em memória com a view `itens` (um item extraído por linha).
+    Usa o Parquet em cache quando disponível (e não descartado); senão, lê direto do DataFrame.
+    Sem nenhum dos dois, retorna a conexão vazia para o chamador registrar suas tabelas.
+    `respostas` (DataFrame com Linha_Planilha e Resposta) vira a tabela `respostas`,
+    com o texto original de cada resposta que gerou itens.
+    """
+    con = duckdb.connect()
+    if caminho_parquet and os.path.exists(caminho_parquet):
+        _marcar_uso(caminho_parquet)
+        caminho_sql = caminho_parquet.replace("'", "''")
+        con.execute(f"CREATE VIEW itens AS SELECT * FROM read_parquet('{caminho_sql}')")
+    elif df_tratado is not None:
+        con.register("itens", df_tratado)
+    if respostas is not None:
+        con.register("respostas", respostas)
+    return con
+
+
+def consultar(con, sql, parametros=None):
+    """Executa uma consulta e retorna o resultado como DataFrame do pandas."""
+    return con.execute(sql, parametros or []).df()
+
+
+# -------------------------
+# Filtros
+# -------------------------
+
+def montar_filtro(filtros):
+    """
+    Converte o dicionário de filtros do dashboard numa cláusula WHERE parametrizada.
+    Chaves aceitas: data_inicio, data_fim, produtos, solicitantes, motivos, estado.
+    """
+    condicoes = ["TRUE"]
+    parametros = []
+
+    # Compara a coluna crua com o início do dia (fim exclusivo: início do dia
+    # seguinte); um CAST em "Data" impediria o descarte de row groups pelo
+    # mínimo/máximo do Parquet e obrigaria a ler o arquivo inteiro
+    if filtros.get("data_inicio") is not None:
+        condicoes.append("\"Data\" >= ?")
+        parametros.append(_inicio_do_dia(filtros["data_inicio"]))
+    if filtros.get("data_fim") is not None:
+        condicoes.append("\"Data\" < ?")
+        parametros.append(_inicio_do_dia(filtros["data_fim"]) + timedelta(days=1))
+
+    for chave, coluna in (("produtos", "Produto"), ("solicitantes", "Solicitante"), ("motivos", "Motivo_Agrupado")):
+        valores = filtros.get(chave)
+        if valores:
+            condicoes.append(f"\"{coluna}\" IN ({', '.join('?' for _ in valores)})")
+            parametros.extend(valores)
+
+    if filtros.get("estado") not in (None, "Todos"):
+        condicoes.append("\"Estado\" = ?")
+        parametros.append(filtros["estado"])
+
+    return " AND ".join(condicoes), parametros
+
+
+def _inicio_do_dia(data):
+    """Meia-noite da data (date do st.date_input) como datetime, o tipo da coluna "Data"."""
+    return datetime.combine(data, datetime.min.time())
+
+
+# -------------------------
+# Agregações do Dashboard
+# -------------------------
+
+def valores_distintos(con, coluna, filtros=None):
+    """Lista ordenada dos valores não nulos de uma coluna (opções dos filtros)."""
+    where, parametros = montar_filtro(filtros or {})
+    df = consultar(con, f"""
+        SELECT DISTINCT CAST("{coluna}" AS VARCHAR) AS valor
+        FROM itens
+        WHERE {where} AND "{coluna}" IS NOT NULL
+        ORDER BY valor
+    """, parametros)
+    return df["valor"].tolist()
+
+
+def periodo(con):
+    """Datas mínima e máxima dos itens (None, None se não houver datas)."""
+    inicio, fim = con.execute(
+        "SELECT MIN(CAST(\"Data\" AS DATE)), MAX(CAST(\"Data\" AS DATE)) FROM itens"
+    ).fetchone()
+    return inicio, fim
+
+
+def metricas(con, filtros):
+    """Totais dos cards: solicitações, volume, valor negociado e produtos únicos."""
+    where, parametros = montar_filtro(filtros)
+    total_solicitacoes, total_quantidade, total_valor, produtos_unicos = con.execute(f"""
+        SELECT
+            COUNT(*),
+            COALESCE(SUM("Quantidade"), 0),
+            COALESCE(SUM("Valor_Total_Item"), 0),
+            COUNT(DISTINCT "Produto")
+        FROM itens
+        WHERE {where}
+    """, parametros).fetchone()
+    return {
+        "total_solicitacoes": total_solicitacoes,
+        "total_quantidade": total_quantidade,
+        "total_valor_negociado": total_valor,
+        "produtos_unicos": produtos_unicos,
+    }
+
+
+def top_produtos_volume(con, filtros, limite=10):
+    """Produtos com maior soma de Quantidade."""
+    where, parametros = montar_filtro(filtros)
+    return consultar(con, f"""
+        SELECT "Produto", SUM("Quantidade") AS "Quantidade Total"
+        FROM itens
+        WHERE {where}
+        GROUP BY "Produto"
+        ORDER BY "Quantidade Total" DESC, "Produto"
+        LIMIT {int(limite)}
+    """, parametros)
+
+
+def top_produtos_frequencia(con, filtros, limite=10):
+    """Produtos com maior número de solicitações (linhas)."""
+    where, parametros = montar_filtro(filtros)
+    return consultar(con, f"""
+        SELECT "Produto", COUNT(*) AS "Contagem de Solicitações"
+        FROM itens
+        WHERE {where}
+        GROUP BY "Produto"
+        ORDER BY "Contagem de Solicitações" DESC, "Produto"
+        LIMIT {int(limite)}
+    """, parametros)
+
+
+def top_solicitantes(con, filtros, limite=15):
+    """Solicitantes mais frequentes, em ordem crescente (para o gráfico de barras horizontais)."""
+    where, parametros = montar_filtro(filtros)
+    return consultar(con, f"""
+        SELECT * FROM (
+            SELECT "Solicitante", COUNT(*) AS "Contagem"
+            FROM itens
+            WHERE {where} AND "Solicitante" IS NOT NULL
+            GROUP BY "Solicitante"
+            ORDER BY "Contagem" DESC, "Solicitante"
+            LIMIT {int(limite)}
+        )
+        ORDER BY "Contagem", "Solicitante" DESC
+    """, parametros)
+
+
+def contagem_motivos(con, filtros):
+    """Número de solicitações por Motivo Agrupado, do mais para o menos frequente."""
+    where, parametros = montar_filtro(filtros)
+    return consultar(con, f"""
+        SELECT "Motivo_Agrupado", COUNT(*) AS "Contagem"
+        FROM itens
+        WHERE {where} AND "Motivo_Agrupado" IS NOT NULL
+        GROUP BY "Motivo_Agrupado"
+        ORDER BY "Contagem" DESC, "Motivo_Agrupado"
+    """, parametros)
+
+
+def lotes_itens_filtrados(con, filtros, tamanho_lote):
+    """Mesmas linhas do itens_filtrados, entregues em lotes (RecordBatchReader) para exportação."""
+    where, parametros = montar_filtro(filtros)
+    return con.execute(
+        f"SELECT * FROM itens WHERE {where}", parametros
+    ).to_arrow_reader(tamanho_lote)
+
+
+# -------------------------
+# Explorador de Itens (paginação no servidor)
+# -------------------------
+
+def _filtro_busca(filtros, busca):
+    """Cláusula WHERE dos filtros mais a busca (trecho de texto, sem diferenciar maiúsculas e acentos)."""
+    where, parametros = montar_filtro(filtros)
+    if busca:
+        # O texto digitado é literal: % e _ não funcionam como curingas do LIKE
+        padrao = "%" + busca.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        condicoes = [f"strip_accents(\"{coluna}\") ILIKE strip_accents(?) ESCAPE '\\'" for coluna in COLUNAS_BUSCA]
+        where = f"{where} AND ({' OR '.join(condicoes)})"
+        parametros = parametros + [padrao] * len(COLUNAS_BUSCA)
+    return where, parametros
+
+
+def contar_itens(con, filtros, busca=""):
+    """Quantidade de itens que atendem aos filtros e à busca."""
+    where, parametros = _filtro_busca(filtros, busca)
+    return con.execute(f"SELECT COUNT(*) FROM itens WHERE {where}", parametros).fetchone()[0]
+
+
+def pagina_itens(con, filtros, busca, ordenar_por, decrescente, limite, inicio):
+    """
+    Uma página dos itens que atendem aos filtros e à busca: `limite` linhas a partir
+    da posição `inicio` na ordenação pedida. O DuckDB ordena só o necessário para
+    a página (top-N), sem ordenar nem copiar a tabela inteira.
+    """
+    if ordenar_por not in COLUNAS_EXPLORADOR:
+        raise ValueError(f"Coluna de ordenação inválida: {ordenar_por}")
+
+    where, parametros = _filtro_busca(filtros, busca)
+    colunas = ", ".join(f'"{coluna}"' for coluna in COLUNAS_EXPLORADOR)
+    # Desempate pelas demais colunas: a mesma página sempre traz os mesmos itens
+    desempate = ", ".join(f'"{coluna}"' for coluna in COLUNAS_EXPLORADOR if coluna != ordenar_por)
+    return consultar(con, f"""
+        SELECT {colunas}
+        FROM itens
+        WHERE {where}
+        ORDER BY "{ordenar_por}" {"DESC" if decrescente else "ASC"} NULLS LAST, {desempate}
+        LIMIT {int(limite)} OFFSET {int(inicio)}
+    """, parametros)
+
+
+def texto_resposta(con, linha):
+    """Texto original da resposta na linha `linha` da planilha, ou None se não estiver disponível."""
+    resultado = con.execute(
+        'SELECT "Resposta" FROM respostas WHERE "Linha_Planilha" = ?', [int(linha)]
+    ).fetchone()
+    return resultado[0] if resultado else None
+
+
+def itens_da_resposta(con, linha):
+    """Todos os itens extraídos da resposta na linha `linha` da planilha (sem filtros)."""
+    colunas = ", ".join(f'"{coluna}"' for coluna in COLUNAS_EXPLORADOR)
+    return consultar(con, f'SELECT {colunas} FROM itens WHERE "Linha_Planilha" = ?', [int(linha)])
+
+
+# -------------------------
+# Caixa de SQL (usuários avançados)
+# -------------------------
+
+class ConsultaInterrompida(Exception):
+    """A consulta da caixa de SQL passou de TEMPO_LIMITE_SQL segundos."""
+
+
+def _criar_view_filtrada(con, nome, filtros):
+    """
+    Cria a view `nome` com os itens que atendem aos filtros, sem copiar as linhas.
+    Views não aceitam parâmetros: cada valor vai para uma variável do DuckDB.
+    """
+    where, parametros = montar_filtro(filtros)
+    partes = where.split("?")
+    for i, valor in enumerate(parametros):
+        con.execute(f"SET VARIABLE filtro_{i} = ?", [valor])
+    where = partes[0] + "".join(f"getvariable('filtro_{i}')" + parte for i, parte in enumerate(partes[1:]))
+    con.execute(f"CREATE VIEW {nome} AS SELECT * FROM itens WHERE {where}")
+
+
+def executar_sql_usuario(sql, itens, filtros, limite=LIMITE_LINHAS_SQL):
+    """
+    Executa a consulta digitada pelo usuário numa conexão isolada, sem acesso a
+    arquivos ou rede, com as tabelas `itens` (DataFrame/Arrow informado) e
+    `itens_filtrados` (view com os filtros atuais). A conexão usa no máximo
+    THREADS_SQL threads e MEMORIA_SQL de memória, e a consulta é interrompida
+    após TEMPO_LIMITE_SQL segundos (ConsultaInterrompida).
+    Retorna no máximo `limite` linhas.
+    """
+    con = duckdb.connect(config={
+        "enable_external_access": False,
+        "threads": THREADS_SQL,
+        "memory_limit": MEMORIA_SQL,
+    })
+    cronometro = threading.Timer(TEMPO_LIMITE_SQL, con.interrupt)
+    try:
+        con.register("itens", itens)
+        _criar_view_filtrada(con, "itens_filtrados", filtros)
+        con.execute("SET lock_configuration = true") # A consulta não pode aumentar os próprios limites
+
+        cronometro.start()
+        relacao = con.sql(sql)
+        if relacao is None:
+            # Comandos que não retornam linhas (ex.: CREATE) não têm o que exibir
+            return pd.DataFrame()
+        return relacao.limit(limite).df()
+    except duckdb.InterruptException:
+        raise ConsultaInterrompida(f"consulta interrompida após {TEMPO_LIMITE_SQL} segundos")
+    finally:
+        cronometro.cancel()
+        con.close()
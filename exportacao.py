@@ -0,0 +1,154 @@
+import tempfile
+import openpyxl
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pcsv
+import pyarrow.parquet as pq
+
+# ----------------------------------------------------
+# Exportação dos dados filtrados (CSV, Parquet e Excel)
+# ----------------------------------------------------
+# Os dados chegam como um pyarrow.RecordBatchReader (ex.: resultado do DuckDB) e
+# são gravados lote a lote num arquivo temporário em disco, então a memória usada
+# na geração não cresce com o número de linhas exportadas.
+
+FORMATOS = {
+    "CSV": (".csv", "text/csv"),
+    "Parquet": (".parquet", "application/vnd.apache.parquet"),
+    "Excel": (".xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
+
+# Linhas por lote lido da fonte (e por row group no Parquet)
+TAMANHO_LOTE = 50_000
+
+# Limite de linhas de uma aba do Excel (incluindo o cabeçalho)
+LIMITE_LINHAS_EXCEL = 1_048_576
+
+# Textos que o Excel (ou o openpyxl, no caso do "=") tomariam por fórmula
+INICIO_FORMULA = r"^[=+\-@]"
+
+
+def tabela_para_lotes(df):
+    """Converte um DataFrame pequeno (ex.: tabela agregada de um gráfico) em RecordBatchReader."""
+    return pa.Table.from_pandas(df, preserve_index=False).to_reader(max_chunksize=TAMANHO_LOTE)
+
+
+def verificar_limite(formato, total_linhas):
+    """
+    Recusa (ValueError) antes de gravar qualquer linha uma exportação que não cabe
+    no formato: o Excel é gerado linha a linha em Python, e descobrir o excesso só
+    no meio da gravação custaria minutos.
+    """
+    if formato == "Excel" and total_linhas + 1 > LIMITE_LINHAS_EXCEL: # +1: cabeçalho
+        raise ValueError(_mensagem_limite_excel(total_linhas))
+
+
+def _mensagem_limite_excel(total_linhas=None):
+    quantidade = f" e a exportação tem {total_linhas:,}" if total_linhas is not None else ""
+    return (
+        f"O Excel suporta no máximo {LIMITE_LINHAS_EXCEL - 1:,} linhas por aba{quantidade}. "
+        "Refine os filtros ou exporte em CSV/Parquet."
+    ).replace(",", ".")
+
+
+def gerar_arquivo(lotes, formato):
+    """Gera o arquivo no formato pedido e retorna seu conteúdo em bytes."""
+    with tempfile.TemporaryFile() as destino:
+        exportar(lotes, formato, destino)
+        destino.seek(0)
+        return destino.read()
+
+
+def exportar(lotes, formato, destino):
+    """Grava os lotes (RecordBatchReader) no arquivo binário `destino`, no formato pedido."""
+    if formato == "CSV":
+        _exportar_csv(lotes, destino)
+    elif formato == "Parquet":
+        _exportar_parquet(lotes, destino)
+    elif formato == "Excel":
+        _exportar_excel(lotes, destino)
+    else:
+        raise ValueError(f"Formato de exportação desconhecido: {formato}")
+
+
+def _exportar_csv(lotes, destino):
+    """CSV no padrão BR (separador ';' e vírgula decimal), escrito lote a lote pelo pyarrow."""
+    # BOM do UTF-8: faz o Excel reconhecer os acentos ao abrir o CSV
+    destino.write(b"\xef\xbb\xbf")
+    schema = _schema_csv(lotes.schema)
+    opcoes = pcsv.WriteOptions(delimiter=";", quoting_style="needed")
+    # O cabeçalho sai mesmo quando não há nenhuma linha
+    with pcsv.CSVWriter(destino, schema, write_options=opcoes) as escritor:
+        for lote in lotes:
+            escritor.write_batch(_formatar_lote_csv(lote, schema))
+
+
+def _schema_csv(schema):
+    """Schema de saída do CSV: decimais viram texto (vírgula decimal) e datas perdem os nanossegundos."""
+    campos = []
+    for campo in schema:
+        if pa.types.is_floating(campo.type):
+            campo = campo.with_type(pa.string())
+        elif pa.types.is_timestamp(campo.type):
+            campo = campo.with_type(pa.timestamp("s", tz=campo.type.tz))
+        campos.append(campo)
+    return pa.schema(campos)
+
+
+def _formatar_lote_csv(lote, schema):
+    """Aplica ao lote as conversões do _schema_csv (tudo vetorizado no Arrow)."""
+    colunas = []
+    for coluna, campo in zip(lote.columns, schema):
+        if pa.types.is_floating(coluna.type):
+            coluna = pc.replace_substring(pc.cast(coluna, pa.string()), ".", ",")
+        elif pa.types.is_timestamp(coluna.type):
+            coluna = pc.cast(coluna, campo.type, safe=False)
+        colunas.append(coluna)
+    return pa.RecordBatch.from_arrays(colunas, schema=schema)
+
+
+def _exportar_parquet(lotes, destino):
+    """Parquet com um row group por lote."""
+    with pq.ParquetWriter(destino, lotes.schema) as escritor:
+        for lote in lotes:
+            escritor.write_batch(lote, row_group_size=TAMANHO_LOTE)
+
+
+def _exportar_excel(lotes, destino):
+    """XLSX em modo write_only do openpyxl (as linhas vão direto para o arquivo)."""
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet("Dados")
+    ws.append(_valores_excel(ws, pa.array(lotes.schema.names, pa.string())))
+
+    linhas_escritas = 1
+    for lote in lotes:
+        linhas_escritas += lote.num_rows
+        if linhas_escritas > LIMITE_LINHAS_EXCEL: # Sem contagem prévia: descoberto durante a gravação
+            raise ValueError(_mensagem_limite_excel())
+        colunas = [_valores_excel(ws, coluna) for coluna in lote.columns]
+        for linha in zip(*colunas):
+            ws.append(linha)
+
+    wb.save(destino)
+
+
+def _valores_excel(ws, coluna):
+    """
+    Valores de uma coluna prontos para o openpyxl. Nos textos, remove os caracteres
+    de controle que o XLSX não aceita (IllegalCharacterError) e grava como texto
+    puro os que começam como fórmula ("=1+1" viraria uma fórmula ativa).
+    """
+    if not pa.types.is_string(coluna.type) and not pa.types.is_large_string(coluna.type):
+        return coluna.to_pylist()
+
+    coluna = pc.replace_substring_regex(coluna, ILLEGAL_CHARACTERS_RE.pattern, "")
+    valores = coluna.to_pylist()
+    formulas = pc.match_substring_regex(coluna, INICIO_FORMULA)
+    if pc.any(formulas).as_py():
+        for i in pc.indices_nonzero(pc.fill_null(formulas, False)).to_pylist():
+            celula = WriteOnlyCell(ws, valores[i])
+            celula.data_type = "s"
+            valores[i] = celula
+    return valores
@@ -0,0 +1,145 @@
+import json
+from functools import lru_cache
+
+import numpy as np
+import plotly.graph_objects as go
+import plotly.io as pio
+from plotly.colors import get_colorscale
+
+try:
+    import orjson # Opcional: serialização bem mais rápida de arrays grandes (ex.: heatmap)
+except ImportError:
+    orjson = None
+
+# ----------------------------------------------------
+# Construção e Serialização das Figuras Plotly
+# ----------------------------------------------------
+# As figuras são montadas direto como dicionários graph_objects a partir de arrays
+# NumPy, sem passar pelo plotly.express nem pela validação propriedade a propriedade
+# (que, com o template, custava a maior parte do tempo de cada gráfico).
+# A figura serializada (JSON) pode ficar em cache e ser redesenhada sem ser
+# reconstruída; desserializar também dispensa a validação.
+
+TEMPLATE_PADRAO = "plotly"
+MOTOR_JSON = "orjson" if orjson is not None else "json"
+
+# Acima deste número de células, o heatmap mostra os valores só no tooltip:
+# cada rótulo de célula é um elemento de texto que o navegador precisa desenhar
+LIMITE_CELULAS_COM_TEXTO = 1_500
+
+
+@lru_cache(maxsize=None)
+def template_resolvido(nome):
+    """Template nomeado (ex.: "plotly_dark") como dicionário. Compartilhado entre as figuras: não alterar."""
+    return pio.templates[nome].to_plotly_json()
+
+
+def figura(tracos, layout, template=TEMPLATE_PADRAO):
+    """Monta a go.Figure a partir de dicionários, sem validação (os construtores abaixo já geram propriedades válidas)."""
+    return go.Figure({"data": tracos, "layout": {"template": template_resolvido(template), **layout}}, _validate=False)
+
+
+def serializar(fig):
+    """JSON da figura (com orjson quando instalado)."""
+    return pio.to_json(fig, validate=False, engine=MOTOR_JSON)
+
+
+def desserializar(texto_json):
+    """Figura a partir do JSON gerado por `serializar`, pronta para o st.plotly_chart."""
+    dados = orjson.loads(texto_json) if orjson is not None else json.loads(texto_json)
+    return go.Figure(dados, _validate=False)
+
+
+def _eixo(titulo, extra=None):
+    return {"anchor": "y", "domain": [0.0, 1.0], "title": {"text": titulo}, **(extra or {})}
+
+
+def barras(x, y, nome_x, nome_y, titulo, cor, texto=None, horizontal=False,
+           eixo_x=None, eixo_y=None, layout=None, template=TEMPLATE_PADRAO):
+    """
+    Gráfico de barras de uma série (equivalente ao px.bar com x/y e cor fixa).
+    `texto` são os rótulos exibidos fora das barras; `eixo_x`/`eixo_y`/`layout`
+    acrescentam propriedades aos eixos e ao layout.
+    """
+    traco = {
+        "type": "bar",
+        "x": np.asarray(x),
+        "y": np.asarray(y),
+        "orientation": "h" if horizontal else "v",
+        "marker": {"color": cor},
+        "hovertemplate": f"{nome_x}=%{{x}}<br>{nome_y}=%{{y}}<extra></extra>",
+        "showlegend": False,
+    }
+    if texto is not None:
+        traco.update(text=np.asarray(texto), texttemplate="%{text}", textposition="outside")
+
+    eixo_x_base = _eixo(nome_x, eixo_x)
+    eixo_y_base = {**_eixo(nome_y, eixo_y), "anchor": "x"}
+    return figura([traco], {
+        "title": {"text": titulo},
+        "xaxis": eixo_x_base,
+        "yaxis": eixo_y_base,
+        "barmode": "relative",
+        **(layout or {}),
+    }, template)
+
+
+def barras_por_grupo(x, y, grupos, nome_x, nome_y, nome_grupo, titulo, template=TEMPLATE_PADRAO):
+    """
+    Barras agrupadas com uma cor (traço) por valor de `grupos`, como o px.bar com
+    color=... e barmode="group". Os grupos aparecem na ordem da primeira ocorrência.
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    grupos = np.asarray(grupos).astype(str)
+    valores, primeira_posicao = np.unique(grupos, return_index=True)
+
+    tracos = []
+    for grupo in valores[np.argsort(primeira_posicao)]:
+        selecao = grupos == grupo
+        tracos.append({
+            "type": "bar",
+            "name": grupo,
+            "legendgroup": grupo,
+            "offsetgroup": grupo,
+            "alignmentgroup": "True",
+            "x": x[selecao],
+            "y": y[selecao],
+            "hovertemplate": f"{nome_x}=%{{x}}<br>{nome_y}=%{{y}}<br>{nome_grupo}={grupo}<extra></extra>",
+            "showlegend": True,
+        })
+
+    return figura(tracos, {
+        "title": {"text": titulo},
+        "xaxis": _eixo(nome_x),
+        "yaxis": {**_eixo(nome_y), "anchor": "x"},
+        "legend": {"title": {"text": nome_grupo}, "tracegroupgap": 0},
+        "barmode": "group",
+    }, template)
+
+
+def mapa_de_calor(tabela, titulo, escala_cores, hovertemplate, formato_texto="%{z:.2f}", template=TEMPLATE_PADRAO):
+    """
+    Heatmap de uma tabela pivoteada (linhas no eixo Y, colunas no eixo X), como o
+    px.imshow(aspect="auto"). Os valores aparecem dentro das células só até
+    LIMITE_CELULAS_COM_TEXTO células.
+    """
+    z = tabela.to_numpy(dtype=float)
+    traco = {
+        "type": "heatmap",
+        "z": z,
+        "x": np.asarray(tabela.columns.astype(str)),
+        "y": np.asarray(tabela.index.astype(str)),
+        "coloraxis": "coloraxis",
+        "hovertemplate": hovertemplate,
+    }
+    if z.size <= LIMITE_CELULAS_COM_TEXTO:
+        traco["texttemplate"] = formato_texto
+
+    return figura([traco], {
+        "title": {"text": titulo},
+        "xaxis": {"anchor": "y", "domain": [0.0, 1.0]},
+        # Eixo Y categórico (códigos de produto não viram números) e de cima para baixo, como numa tabela
+        "yaxis": {"anchor": "x", "domain": [0.0, 1.0], "autorange": "reversed", "type": "category"},
+        "coloraxis": {"colorscale": get_colorscale(escala_cores)},
+    }, template)
@@ -0,0 +1,173 @@
+import pandas as pd
+
+try:
+    import polars as pl # Opcional: só necessário com o motor "polars"
+except ImportError:
+    pl = None
+
+# ----------------------------------------------------
+# Motores de Dados (tratamento dos itens extraídos)
+# ----------------------------------------------------
+# O pós-processamento dos itens extraídos (datas, limpeza, padronização e valor
+# total) pode rodar em pandas (padrão) ou em Polars, que executa o plano de
+# consulta de forma preguiçosa (lazy) e em várias threads. Os dois motores
+# recebem os mesmos itens e devolvem o mesmo DataFrame do pandas, que segue
+# para o cache Parquet e para as consultas do DuckDB.
+# As padronizações são funções Python por valor: os dois motores as aplicam
+# uma vez por valor distinto da coluna, e não uma vez por linha.
+
+MOTOR_PADRAO = "pandas"
+
+# Ordem das colunas do DataFrame tratado (igual nos dois motores)
+COLUNAS_TRATADAS = [
+    "Data", "Produto", "Quantidade", "Preco_Solicitado", "Estado", "Solicitante", "Motivo",
+    "Contagem_Solicitacao", "Data_Dia", "AnoMes", "AnoSemana", "Motivo_Agrupado", "Valor_Total_Item", "Linha_Planilha",
+]
+
+
+def converter_datas(valores):
+    """
+    Converte a coluna de datas (datetimes do Excel ou textos) para datetime64, com
+    NaT onde não for possível. Fica no pandas nos dois motores: a inferência de
+    formatos do pd.to_datetime é a referência do dashboard.
+    """
+    return pd.to_datetime(pd.Series(valores), errors="coerce")
+
+
+def mapear_valores_distintos(valores, funcao):
+    """Aplica `funcao` uma vez por valor distinto e devolve o mapa {valor: resultado}."""
+    return {valor: funcao(valor) for valor in pd.unique(pd.Series(valores, dtype=object))}
+
+
+class MotorPandas:
+    """Tratamento em pandas (motor padrão)."""
+
+    nome = "pandas"
+
+    def finalizar_tratamento(self, dados_tratados, padronizacoes):
+        """
+        Monta o DataFrame tratado a partir dos itens extraídos.
+        `padronizacoes`: {coluna de destino: (coluna de origem, função por valor)}.
+        """
+        df_tratado = pd.DataFrame(dados_tratados)
+        if df_tratado.empty:
+            return df_tratado
+
+        # Limpeza e criação de colunas de tempo
+        df_tratado["Data"] = converter_datas(df_tratado["Data"])
+        df_tratado = df_tratado.dropna(subset=["Data"]) # Remove linhas sem data válida
+
+        df_tratado["Data_Dia"] = df_tratado["Data"].dt.strftime("%Y-%m-%d")
+        df_tratado["AnoMes"] = df_tratado["Data"].dt.to_period("M").astype(str)
+        df_tratado["AnoSemana"] = df_tratado["Data"].dt.strftime("%Y-%W")
+
+        # Filtragem de dados nulos/inválidos de Produto
+        df_tratado = df_tratado.dropna(subset=["Produto"])
+        df_tratado = df_tratado[df_tratado["Produto"].str.lower() != "none"]
+
+        # Ajuste: Garantir que Quantidade é um número inteiro ANTES DA AGREGAÇÃO
+        df_tratado["Quantidade"] = pd.to_numeric(df_tratado["Quantidade"], errors='coerce').fillna(0).astype(int)
+        # Preço sempre numérico, mesmo num lote em que nenhum item tem preço (como no Polars)
+        df_tratado["Preco_Solicitado"] = pd.to_numeric(df_tratado["Preco_Solicitado"], errors="coerce")
+
+        # Padronização
+        for destino, (origem, funcao) in padronizacoes.items():
+            mapa = mapear_valores_distintos(df_tratado[origem], funcao)
+            df_tratado[destino] = df_tratado[origem].map(mapa).astype(object)
+
+        # Cálculo do Valor Total do Item
+        df_tratado["Valor_Total_Item"] = df_tratado["Quantidade"] * df_tratado["Preco_Solicitado"]
+
+        return df_tratado[COLUNAS_TRATADAS].reset_index(drop=True)
+
+
+class MotorPolars:
+    """
+    Tratamento em Polars: as etapas viram um único plano lazy, otimizado e executado
+    em paralelo pelo Polars; o resultado é convertido para pandas no final.
+    """
+
+    nome = "polars"
+
+    def __init__(self):
+        if pl is None:
+            raise ValueError("O motor de dados 'polars' precisa do pacote polars (pip install polars).")
+
+    def finalizar_tratamento(self, dados_tratados, padronizacoes):
+        """Mesmo contrato e mesmo resultado do MotorPandas.finalizar_tratamento."""
+        if not dados_tratados:
+            return pd.DataFrame()
+
+        # NaN vira None: no Polars, nulo é sempre null (e não o texto "NaN" numa coluna de texto)
+        colunas = {
+            coluna: [None if valor is None or (isinstance(valor, float) and pd.isna(valor)) else valor
+                     for valor in (item.get(coluna) for item in dados_tratados)]
+            for coluna in dados_tratados[0]
+        }
+
+        # Padronizações calculadas por valor distinto e aplicadas como substituição vetorizada
+        # (as chaves viram texto, como a coluna de origem no Polars)
+        substituicoes = {}
+        for destino, (origem, funcao) in padronizacoes.items():
+            mapa = {
+                str(valor): resultado if resultado is None or isinstance(resultado, str) else str(resultado)
+                for valor, resultado in mapear_valores_distintos(colunas[origem], funcao).items()
+                if valor is not None
+            }
+            substituicoes[destino] = (origem, mapa, funcao(None))
+
+        tabela = pl.DataFrame({
+            "Data": pl.Series(converter_datas(colunas["Data"]).to_numpy()),
+            **{
+                coluna: pl.Series(valores, strict=False)
+                for coluna, valores in colunas.items() if coluna != "Data"
+            },
+        })
+        # Colunas que vieram vazias (só None) precisam de tipo para as expressões abaixo
+        tabela = tabela.with_columns(
+            pl.col(coluna).cast(pl.String) for coluna in ("Produto", "Estado", "Solicitante", "Motivo")
+            if tabela.schema[coluna] == pl.Null
+        ).with_columns(
+            pl.col("Preco_Solicitado").cast(pl.Float64, strict=False)
+        )
+
+        plano = (
+            tabela.lazy()
+            # Limpeza e criação de colunas de tempo
+            .filter(pl.col("Data").is_not_null())
+            .with_columns(
+                pl.col("Data").dt.strftime("%Y-%m-%d").alias("Data_Dia"),
+                pl.col("Data").dt.strftime("%Y-%m").alias("AnoMes"),
+                pl.col("Data").dt.strftime("%Y-%W").alias("AnoSemana"),
+            )
+            # Filtragem de dados nulos/inválidos de Produto
+            .filter(pl.col("Produto").is_not_null() & (pl.col("Produto").cast(pl.String).str.to_lowercase() != "none"))
+            # Quantidade inteira (texto inválido vira 0)
+            .with_columns(
+                pl.col("Quantidade").cast(pl.Float64, strict=False).fill_null(0).cast(pl.Int64)
+            )
+            # Padronização
+            .with_columns(
+                pl.col(origem).cast(pl.String).replace_strict(mapa, default=padrao_nulo, return_dtype=pl.String)
+                .alias(destino)
+                for destino, (origem, mapa, padrao_nulo) in substituicoes.items()
+            )
+            # Cálculo do Valor Total do Item
+            .with_columns((pl.col("Quantidade") * pl.col("Preco_Solicitado")).alias("Valor_Total_Item"))
+            .select(COLUNAS_TRATADAS)
+        )
+
+        df_tratado = plano.collect().to_pandas()
+        # Datas em nanossegundos, como no pandas
+        df_tratado["Data"] = df_tratado["Data"].astype("datetime64[ns]")
+        return df_tratado
+
+
+MOTORES = {motor.nome: motor for motor in (MotorPandas, MotorPolars)}
+
+
+def obter_motor(nome=MOTOR_PADRAO):
+    """Instância do motor de dados pelo nome ("pandas" ou "polars")."""
+    if nome not in MOTORES:
+        raise ValueError(f"Motor de dados desconhecido: {nome}. Opções: {', '.join(MOTORES)}.")
+    return MOTORES[nome]()
@@ -0,0 +1,161 @@
+"""
+Paridade e tempo dos motores de dados do tratamento (pandas x Polars).
+
+Roda o finalizar_tratamento do app1 nos dois motores com os mesmos itens extraídos
+e compara os DataFrames resultantes coluna a coluna. Os itens vêm de uma planilha
+real (--planilha) ou são sintéticos: casos de borda fixos (nulos, NaN, produto
+"None", quantidades em texto, datas inválidas, motivos acentuados) somados a itens
+aleatórios. Termina com erro se os resultados forem diferentes.
+
+Uso:
+    python paridade_motores.py [--itens 200000] [--semente 42] [--planilha arquivo.xlsx] [--repeticoes 3]
+"""
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+import app1 # Fora do `streamlit run`, o Streamlit avisa que está em "bare mode"; pode ignorar
+import motores
+
+# -------------------------
+# Casos de borda fixos
+# -------------------------
+CASOS_BORDA = [
+    {"Data": datetime(2025, 1, 2, 10, 30), "Produto": "00012026", "Quantidade": 4, "Preco_Solicitado": 10.5,
+     "Estado": "pr", "Solicitante": "fulano", "Motivo": "Promoção da concorrência", "Contagem_Solicitacao": 1},
+    {"Data": "2025-02-03", "Produto": "23131", "Quantidade": "7", "Preco_Solicitado": 3.2,
+     "Estado": None, "Solicitante": None, "Motivo": None, "Contagem_Solicitacao": 1},
+    {"Data": "data inválida", "Produto": "45678", "Quantidade": 1, "Preco_Solicitado": 1.0,
+     "Estado": "SP", "Solicitante": "Beltrano", "Motivo": "preço", "Contagem_Solicitacao": 1},
+    {"Data": None, "Produto": "45678", "Quantidade": 1, "Preco_Solicitado": 1.0,
+     "Estado": "SP", "Solicitante": "Beltrano", "Motivo": "preço", "Contagem_Solicitacao": 1},
+    {"Data": float("nan"), "Produto": "45678", "Quantidade": 1, "Preco_Solicitado": 1.0,
+     "Estado": "SP", "Solicitante": "Beltrano", "Motivo": "preço", "Contagem_Solicitacao": 1},
+    {"Data": datetime(2025, 3, 4), "Produto": None, "Quantidade": 2, "Preco_Solicitado": 5.0,
+     "Estado": "RS", "Solicitante": "Ciclano", "Motivo": "estoque", "Contagem_Solicitacao": 1},
+    {"Data": datetime(2025, 3, 4), "Produto": "None", "Quantidade": 2, "Preco_Solicitado": 5.0,
+     "Estado": "RS", "Solicitante": "Ciclano", "Motivo": "estoque", "Contagem_Solicitacao": 1},
+    {"Data": datetime(2025, 3, 4), "Produto": "NONE", "Quantidade": 2, "Preco_Solicitado": 5.0,
+     "Estado": "RS", "Solicitante": "Ciclano", "Motivo": "estoque", "Contagem_Solicitacao": 1},
+    {"Data": datetime(2025, 3, 5), "Produto": " 000 ", "Quantidade": "abc", "Preco_Solicitado": None,
+     "Estado": "  sc ", "Solicitante": "FULANO", "Motivo": "   ", "Contagem_Solicitacao": 1},
+    {"Data": datetime(2025, 12, 31, 23, 59), "Produto": "ABC-1", "Quantidade": None, "Preco_Solicitado": float("nan"),
+     "Estado": float("nan"), "Solicitante": float("nan"), "Motivo": float("nan"), "Contagem_Solicitacao": 1},
+    {"Data": datetime(2024, 12, 30), "Produto": "99999", "Quantidade": 3.7, "Preco_Solicitado": 0.0,
+     "Estado": "mg", "Solicitante": "ciclano", "Motivo": "MANTER OS VALORES DO PEDIDO ANTERIOR",
+     "Contagem_Solicitacao": 1},
+    {"Data": datetime(2025, 6, 1), "Produto": "12345", "Quantidade": -2, "Preco_Solicitado": 99.99,
+     "Estado": "ba", "Solicitante": "Fulano", "Motivo": "Motivo sem nenhuma regra", "Contagem_Solicitacao": 1},
+]
+
+PRODUTOS = ["00012026", "23131", "45678", "0099", "ABC-1", "12345", "None", None]
+ESTADOS = ["pr", "PR", "sp", " sc", "rs", "mg", None]
+SOLICITANTES = ["fulano", "Beltrano", "CICLANO", "Fulano de Tal", None]
+MOTIVOS = [
+    "promoção", "preço da concorrência", "estoque parado", "manter valores",
+    "cliente pediu desconto", "Outro motivo qualquer", "", None,
+]
+
+
+def gerar_itens(quantidade, semente):
+    """Casos de borda + `quantidade` itens aleatórios, no formato devolvido pelo tratar_linha."""
+    aleatorio = random.Random(semente)
+    inicio = datetime(2024, 1, 1)
+    itens = [{**caso, "Linha_Planilha": linha} for linha, caso in enumerate(CASOS_BORDA, start=2)]
+    for linha in range(len(itens) + 2, len(itens) + 2 + quantidade):
+        itens.append({
+            "Data": inicio + timedelta(minutes=aleatorio.randint(0, 600_000)),
+            "Produto": aleatorio.choice(PRODUTOS),
+            "Quantidade": aleatorio.choice([aleatorio.randint(1, 50), None, "3"]),
+            "Preco_Solicitado": round(aleatorio.uniform(0.5, 500), 2),
+            "Estado": aleatorio.choice(ESTADOS),
+            "Solicitante": aleatorio.choice(SOLICITANTES),
+            "Motivo": aleatorio.choice(MOTIVOS),
+            "Contagem_Solicitacao": 1,
+            "Linha_Planilha": linha,
+        })
+    return itens
+
+
+def itens_da_planilha(caminho):
+    """Itens extraídos de uma planilha real, pelo mesmo caminho do ProcessamentoPlanilha."""
+    colunas, _, lotes = app1.ler_planilha_em_lotes(caminho, app1.ProcessamentoPlanilha.TAMANHO_LOTE)
+    itens = []
+    posicao = 0
+    for df_lote in lotes:
+        itens.extend(app1.extrair_lote(df_lote, colunas, posicao)[0])
+        posicao += len(df_lote)
+    return itens
+
+
+def medir(motor, itens, repeticoes):
+    """Resultado do motor e o menor tempo (s) entre as repetições."""
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = motor.finalizar_tratamento(itens, app1.PADRONIZACOES)
+        tempos.append(time.perf_counter() - inicio)
+    return resultado, min(tempos)
+
+
+def nulos_uniformes(df):
+    """
+    None em todos os nulos das colunas de texto. No pandas, um texto nulo pode ser
+    None ou NaN (como veio do Excel); no Polars é sempre null. Para o Parquet e o
+    DuckDB os dois são o mesmo NULL.
+    """
+    df = df.copy()
+    for coluna in df.columns[df.dtypes == object]:
+        df[coluna] = df[coluna].where(df[coluna].notna(), None)
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--itens", type=int, default=200_000, help="Quantidade de itens sintéticos")
+    parser.add_argument("--semente", type=int, default=42, help="Semente do gerador aleatório")
+    parser.add_argument("--planilha", help="Usa os itens extraídos desta planilha em vez dos sintéticos")
+    parser.add_argument("--repeticoes", type=int, default=3, help="Execuções por motor (vale o menor tempo)")
+    args = parser.parse_args()
+
+    if args.planilha:
+        try:
+            itens = itens_da_planilha(args.planilha)
+        except app1.ErroPlanilha as e:
+            print(e.mensagem)
+            return 1
+        print(f"Planilha {args.planilha}: {len(itens)} itens extraídos")
+    else:
+        itens = gerar_itens(args.itens, args.semente)
+        print(f"Itens sintéticos: {len(itens)} ({len(CASOS_BORDA)} casos de borda)")
+
+    resultados = {}
+    for nome in motores.MOTORES:
+        try:
+            motor = motores.obter_motor(nome)
+        except ValueError as e:
+            print(f"{nome:<8} indisponível: {e}")
+            continue
+        resultados[nome], segundos = medir(motor, itens, args.repeticoes)
+        print(f"{nome:<8} {segundos * 1000:>10.1f} ms  {len(resultados[nome])} linhas")
+
+    referencia = resultados.pop(motores.MOTOR_PADRAO)
+    falhas = 0
+    for nome, resultado in resultados.items():
+        try:
+            pd.testing.assert_frame_equal(nulos_uniformes(resultado), nulos_uniformes(referencia))
+        except AssertionError as e:
+            falhas += 1
+            print(f"FALHA: {nome} difere do {motores.MOTOR_PADRAO}:\n{e}")
+        else:
+            print(f"OK: {nome} igual ao {motores.MOTOR_PADRAO}")
+
+    return 1 if falhas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
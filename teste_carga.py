@@ -0,0 +1,357 @@
+"""
+Teste de carga dos dashboards (app1.py e app.py) com várias sessões simultâneas.
+
+Cada sessão é um AppTest do Streamlit rodando numa thread própria, como as
+sessões do servidor, todas no mesmo processo (compartilhando caches e GIL).
+Cada uma carrega uma planilha sintética e depois clica nos filtros: produto,
+solicitante, motivo e estado no app1; seleção de produto no app.py.
+
+Relatório:
+  - latência das reexecuções após cada clique (p50/p95/p99);
+  - vazão (reexecuções por segundo, somando todas as sessões);
+  - tempo até o dashboard completo (upload + processamento);
+  - memória por sessão (crescimento do RSS do processo / número de sessões).
+
+Termina com erro se alguma sessão falhar ou se o p95 passar de --limite-p95-ms,
+para servir de teste de regressão.
+
+Uso:
+    python teste_carga.py [--app app1.py] [--sessoes 8] [--interacoes 20] [--linhas 2000]
+                          [--planilha-unica] [--reusar-cache] [--semente 42]
+                          [--limite-p95-ms 0] [--json resultado.json]
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import pandas as pd
+import streamlit as st
+from streamlit import config
+from streamlit.runtime import Runtime
+from streamlit.runtime.uploaded_file_manager import UploadedFile, UploadedFileRec
+from streamlit.testing.v1 import AppTest, app_test
+
+import consultas
+
+PASTA_APPS = os.path.dirname(os.path.abspath(__file__))
+MIME_XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# Chave do session_state com o caminho da planilha que a sessão "carregou"
+CHAVE_ARQUIVO_SESSAO = "_teste_carga_arquivo"
+
+# -------------------------
+# Upload simulado
+# -------------------------
+# O AppTest não simula o st.file_uploader, então ele é substituído por uma função
+# que devolve a planilha da sessão atual (lida do session_state). Assim várias
+# sessões simultâneas podem carregar planilhas diferentes.
+_conteudo_planilhas = {}
+
+
+def upload_simulado(*args, **kwargs):
+    caminho = st.session_state.get(CHAVE_ARQUIVO_SESSAO)
+    if caminho is None:
+        return None
+    registro = UploadedFileRec(caminho, os.path.basename(caminho), MIME_XLSX, _conteudo_planilhas[caminho])
+    return UploadedFile(registro, None)
+
+
+def permitir_sessoes_simultaneas():
+    """
+    O AppTest foi feito para uma sessão por vez: cada run() instala um Runtime
+    simulado global (e o apaga no fim) e liga a opção global.appTest só durante a
+    execução. Com sessões em threads, uma apagaria o que a outra está usando.
+    Aqui a opção fica ligada o tempo todo e o último Runtime simulado instalado
+    continua valendo entre as execuções.
+    """
+    config.set_option("global.appTest", True)
+    app_test.patch_config_options = lambda opcoes: contextlib.nullcontext()
+
+    ultimo = {"runtime": None}
+
+    def instance(cls):
+        if cls._instance is not None:
+            ultimo["runtime"] = cls._instance
+        if ultimo["runtime"] is None:
+            raise RuntimeError("Runtime hasn't been created!")
+        return ultimo["runtime"]
+
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(lambda cls: cls._instance is not None or ultimo["runtime"] is not None)
+
+
+# -------------------------
+# Planilhas sintéticas
+# -------------------------
+MOTIVOS = [
+    "Cliente solicitou desconto", "Aumentar volume", "Negociação de preço",
+    "Cliente pagou da última vez", "Manter os valores", "Pedido do cliente", "Concorrência",
+]
+ESTADOS = ["PR", "sc", "RS", "sp", "Mato grosso do sul"]
+SOLICITANTES = ["Griele", "Bianca Nunes", "Renata Jesus", "Carlos", "Sarah Macieski"]
+UFS = ["SP", "PR", "SC", "RS", "MG", "RJ", "BA", "GO", "MS", "MT"]
+
+
+def gerar_planilha_solicitacoes(caminho, linhas, semente):
+    """Respostas do formulário de negociação (formato lido pelo app1)."""
+    aleatorio = random.Random(semente)
+    inicio = pd.Timestamp("2025-01-01")
+    respostas = []
+    for _ in range(linhas):
+        itens = " ".join(
+            f"{aleatorio.randint(10_000, 10_100)} X {aleatorio.randint(1, 50)} "
+            f"R$ {aleatorio.randint(1, 300)},{aleatorio.randint(0, 99):02d}"
+            for _ in range(aleatorio.randint(1, 4))
+        )
+        respostas.append({
+            "Carimbo de data/hora": inicio + pd.Timedelta(days=aleatorio.randint(0, 300)),
+            "CODIGO DO PRODUTO, QUANTIDADE E PREÇO SOLICITADO:": itens,
+            "ANALISE NEGOCIAÇÃO": "ok",
+            "ESTADO:": aleatorio.choice(ESTADOS),
+            "SOLICITANTE:": aleatorio.choice(SOLICITANTES),
+            "MOTIVO:": aleatorio.choice(MOTIVOS),
+        })
+    pd.DataFrame(respostas).to_excel(caminho, sheet_name="Respostas do Formulário 1", index=False)
+
+
+def gerar_planilha_precos(caminho, linhas, semente):
+    """Preços médios por produto e UF (formato lido pelo app.py)."""
+    aleatorio = random.Random(semente)
+    pd.DataFrame({
+        "Produto": [aleatorio.randint(10_000, 10_300) for _ in range(linhas)],
+        "UF Cliente": [aleatorio.choice(UFS) for _ in range(linhas)],
+        "Preço Médio Venda": [round(aleatorio.uniform(1, 300), 2) for _ in range(linhas)],
+    }).to_excel(caminho, index=False)
+
+
+# -------------------------
+# Interações (cliques) de cada app
+# -------------------------
+
+def _widget(at, tipo, chave=None):
+    """Widget do tipo pedido (pela chave, ou o primeiro), ou None se não estiver na tela."""
+    try:
+        return getattr(at, tipo)(key=chave) if chave else getattr(at, tipo)[0]
+    except (KeyError, IndexError):
+        return None
+
+
+def _amostra(aleatorio, opcoes, maximo=3):
+    return aleatorio.sample(list(opcoes), min(len(opcoes), aleatorio.randint(0, maximo)))
+
+
+def clicar_app1(at, aleatorio):
+    """Muda um dos filtros do app1: produto, solicitante, motivo ou estado."""
+    chave = aleatorio.choice(["produto_sel", "solicitante_sel", "motivo_sel", "estado_selecionado"])
+    if chave == "estado_selecionado":
+        widget = _widget(at, "selectbox", chave)
+        if widget is not None:
+            widget.set_value(aleatorio.choice(widget.options))
+            return
+        chave = "produto_sel" # Sem dados com os filtros atuais: volta a mexer nos filtros laterais
+
+    widget = _widget(at, "multiselect", chave)
+    if widget is not None:
+        widget.set_value(_amostra(aleatorio, widget.options))
+
+
+def clicar_app(at, aleatorio):
+    """Escolhe outro produto (ou "Todos") no app.py."""
+    widget = _widget(at, "selectbox")
+    if widget is not None:
+        widget.set_value(aleatorio.choice(widget.options))
+
+
+APPS = {
+    "app1.py": (gerar_planilha_solicitacoes, clicar_app1),
+    "app.py": (gerar_planilha_precos, clicar_app),
+}
+
+
+# -------------------------
+# Sessões
+# -------------------------
+
+def memoria_rss():
+    """Memória residente atual do processo, em bytes (pico, fora do Linux)."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        maximo = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maximo if sys.platform == "darwin" else maximo * 1024
+
+
+def falha_sessao(at):
+    """Texto do erro exibido pelo app, ou None."""
+    if at.exception:
+        return at.exception[0].message
+    if at.error:
+        return at.error[0].value
+    return None
+
+
+class Sessao:
+    """Um analista: carrega a planilha e faz `interacoes` cliques, medindo cada reexecução."""
+
+    def __init__(self, numero, caminho_app, caminho_planilha, interacoes, clicar, semente, timeout):
+        self.numero = numero
+        self.interacoes = interacoes
+        self.clicar = clicar
+        self.aleatorio = random.Random(semente)
+        self.at = AppTest.from_file(caminho_app, default_timeout=timeout)
+        self.at.session_state[CHAVE_ARQUIVO_SESSAO] = caminho_planilha
+        self.tempo_carga = None
+        self.latencias = []
+        self.reexecucoes = 0
+        self.erro = None
+
+    def executar(self, largada):
+        largada.wait() # Todas as sessões começam juntas
+        try:
+            inicio = time.perf_counter()
+            self._rodar()
+            # Dashboard parcial: o app reexecuta sozinho até o processamento terminar
+            while self.at.get("progress") and not falha_sessao(self.at):
+                self._rodar()
+            self.tempo_carga = time.perf_counter() - inicio
+            self.erro = falha_sessao(self.at)
+
+            for _ in range(self.interacoes if self.erro is None else 0):
+                self.clicar(self.at, self.aleatorio)
+                inicio = time.perf_counter()
+                self._rodar()
+                self.latencias.append(time.perf_counter() - inicio)
+                self.erro = falha_sessao(self.at)
+                if self.erro is not None:
+                    break
+        except Exception as e: # Ex.: timeout do AppTest
+            self.erro = f"{type(e).__name__}: {e}"
+
+    def _rodar(self):
+        self.at.run()
+        self.reexecucoes += 1
+
+
+def percentil(valores, p):
+    """Percentil `p` (0-100) pelo método do posto mais próximo."""
+    ordenados = sorted(valores)
+    if not ordenados:
+        return float("nan")
+    posicao = max(0, min(len(ordenados) - 1, round(p / 100 * len(ordenados) + 0.5) - 1))
+    return ordenados[posicao]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--app", choices=sorted(APPS), default="app1.py", help="Dashboard testado")
+    parser.add_argument("--sessoes", type=int, default=8, help="Sessões simultâneas")
+    parser.add_argument("--interacoes", type=int, default=20, help="Cliques em filtros por sessão")
+    parser.add_argument("--linhas", type=int, default=2_000, help="Linhas de cada planilha sintética")
+    parser.add_argument("--planilha-unica", action="store_true",
+                        help="Todas as sessões carregam a mesma planilha (caches compartilhados)")
+    parser.add_argument("--reusar-cache", action="store_true",
+                        help="Usa o cache Parquet já existente em vez de uma pasta vazia")
+    parser.add_argument("--semente", type=int, default=42, help="Semente das planilhas e dos cliques")
+    parser.add_argument("--timeout", type=float, default=600.0, help="Tempo máximo de uma reexecução (s)")
+    parser.add_argument("--limite-p95-ms", type=float, default=0.0, help="Falha se o p95 passar disso (0 = sem limite)")
+    parser.add_argument("--json", help="Grava o resultado neste arquivo (para comparar execuções)")
+    args = parser.parse_args()
+
+    gerar_planilha, clicar = APPS[args.app]
+    pasta_temporaria = tempfile.mkdtemp(prefix="teste_carga_")
+    if not args.reusar_cache:
+        consultas.PASTA_CACHE = pasta_temporaria # Sem cache: mede o processamento completo
+    st.file_uploader = upload_simulado
+    permitir_sessoes_simultaneas()
+
+    try:
+        print(f"Gerando planilhas sintéticas ({args.linhas} linhas)...")
+        planilhas = []
+        for numero in range(1 if args.planilha_unica else args.sessoes):
+            caminho = os.path.join(pasta_temporaria, f"planilha_{numero}.xlsx")
+            gerar_planilha(caminho, args.linhas, args.semente + numero)
+            with open(caminho, "rb") as arquivo:
+                _conteudo_planilhas[caminho] = arquivo.read()
+            planilhas.append(caminho)
+
+        memoria_inicial = memoria_rss()
+        sessoes = [
+            Sessao(
+                numero, os.path.join(PASTA_APPS, args.app), planilhas[numero % len(planilhas)],
+                args.interacoes, clicar, args.semente + numero, args.timeout,
+            )
+            for numero in range(args.sessoes)
+        ]
+        largada = threading.Barrier(len(sessoes))
+        threads = [threading.Thread(target=sessao.executar, args=(largada,)) for sessao in sessoes]
+
+        print(f"Rodando {args.sessoes} sessões simultâneas de {args.app}...")
+        inicio = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duracao = time.perf_counter() - inicio
+        memoria_final = memoria_rss() # Com as sessões ainda vivas
+    finally:
+        shutil.rmtree(pasta_temporaria, ignore_errors=True)
+
+    latencias = [latencia for sessao in sessoes for latencia in sessao.latencias]
+    tempos_carga = [sessao.tempo_carga for sessao in sessoes if sessao.tempo_carga is not None]
+    falhas = [(sessao.numero, sessao.erro) for sessao in sessoes if sessao.erro is not None]
+    resultado = {
+        "app": args.app,
+        "sessoes": args.sessoes,
+        "interacoes_por_sessao": args.interacoes,
+        "linhas_planilha": args.linhas,
+        "planilha_unica": args.planilha_unica,
+        "duracao_s": duracao,
+        "reexecucoes": sum(sessao.reexecucoes for sessao in sessoes),
+        "vazao_reexecucoes_por_s": sum(sessao.reexecucoes for sessao in sessoes) / duracao,
+        "latencia_p50_ms": percentil(latencias, 50) * 1000,
+        "latencia_p95_ms": percentil(latencias, 95) * 1000,
+        "latencia_p99_ms": percentil(latencias, 99) * 1000,
+        "latencia_max_ms": max(latencias, default=float("nan")) * 1000,
+        "carga_p50_s": percentil(tempos_carga, 50),
+        "carga_max_s": max(tempos_carga, default=float("nan")),
+        "memoria_por_sessao_mb": (memoria_final - memoria_inicial) / args.sessoes / 2**20,
+        "memoria_processo_mb": memoria_final / 2**20,
+        "falhas": falhas,
+    }
+
+    print(f"\nDuração: {duracao:.1f} s, {resultado['reexecucoes']} reexecuções "
+          f"({resultado['vazao_reexecucoes_por_s']:.1f}/s)")
+    print(f"Latência após clique (ms): p50 {resultado['latencia_p50_ms']:.0f}, "
+          f"p95 {resultado['latencia_p95_ms']:.0f}, p99 {resultado['latencia_p99_ms']:.0f}, "
+          f"máx {resultado['latencia_max_ms']:.0f} ({len(latencias)} cliques)")
+    print(f"Dashboard completo após o upload (s): p50 {resultado['carga_p50_s']:.1f}, "
+          f"máx {resultado['carga_max_s']:.1f}")
+    print(f"Memória: {resultado['memoria_por_sessao_mb']:.1f} MB por sessão "
+          f"(processo com {resultado['memoria_processo_mb']:.0f} MB)")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as arquivo:
+            json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+
+    if falhas:
+        for numero, erro in falhas:
+            print(f"FALHA na sessão {numero}: {erro}")
+        return 1
+    if args.limite_p95_ms and resultado["latencia_p95_ms"] > args.limite_p95_ms:
+        print(f"FALHA: p95 acima de {args.limite_p95_ms:.0f} ms")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
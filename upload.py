@@ -0,0 +1,76 @@
+import hashlib
+import io
+
+# ----------------------------------------------------
+# Tratamento do Arquivo Carregado (sem cópias do conteúdo)
+# ----------------------------------------------------
+# O st.file_uploader entrega um UploadedFile (um BytesIO que compartilha os bytes
+# recebidos pelo servidor). Aqui o conteúdo é exposto como um único memoryview,
+# usado tanto para calcular o digest quanto para a leitura do Excel, sem duplicar
+# os bytes em memória.
+
+TAMANHO_BLOCO = 1024 * 1024 # 1 MiB por bloco no cálculo do digest
+
+
+def visao_upload(arquivo):
+    """
+    memoryview somente leitura do conteúdo do upload.
+    getvalue() devolve os próprios bytes do upload (o BytesIO ainda não foi
+    modificado), então nenhuma cópia é feita; já getbuffer() copiaria.
+    """
+    return memoryview(arquivo.getvalue())
+
+
+def calcular_digest(buffer):
+    """SHA-256 do conteúdo, calculado em blocos sobre o memoryview (estável entre processos)."""
+    sha = hashlib.sha256()
+    for inicio in range(0, len(buffer), TAMANHO_BLOCO):
+        sha.update(buffer[inicio:inicio + TAMANHO_BLOCO]) # Fatiar memoryview não copia
+    return sha.hexdigest()
+
+
+class LeitorBuffer(io.RawIOBase):
+    """
+    Arquivo binário somente leitura sobre um memoryview, para entregar o upload ao
+    leitor do Excel (openpyxl/zipfile) sem o io.BytesIO(...) que copiaria tudo.
+    Cada leitor tem sua própria posição, então o mesmo buffer pode ser lido por
+    vários consumidores.
+    """
+
+    def __init__(self, buffer):
+        super().__init__()
+        self._buffer = buffer
+        self._posicao = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._posicao
+
+    def seek(self, deslocamento, origem=io.SEEK_SET):
+        if origem == io.SEEK_SET:
+            posicao = deslocamento
+        elif origem == io.SEEK_CUR:
+            posicao = self._posicao + deslocamento
+        elif origem == io.SEEK_END:
+            posicao = len(self._buffer) + deslocamento
+        else:
+            raise ValueError(f"Origem de seek inválida: {origem}")
+        if posicao < 0:
+            raise ValueError("Posição negativa no seek")
+        self._posicao = posicao
+        return self._posicao
+
+    def readinto(self, destino):
+        trecho = self._buffer[self._posicao:self._posicao + len(destino)]
+        destino[:len(trecho)] = trecho
+        self._posicao += len(trecho)
+        return len(trecho)
+
+    def close(self):
+        self._buffer = None # Não segura o upload depois de fechado
+        super().close()